@@ -16,4 +16,5 @@
 
 
 from .book import book
-from . import style, to, read, dist
+from .util import Capture
+from . import style, to, read, dist, record
@@ -3,8 +3,6 @@ import asyncio
 import functools
 import threading
 
-from .util import CallMap
-
 
 class _book_compat(object):
 
@@ -25,6 +23,16 @@ class _book_compat(object):
             cls._shelves[task] = [None]
         return cls._shelves[task]
 
+    @classmethod
+    def _now(cls):
+        return cls.shelf()[-1]
+
+    def _push(self):
+        self.shelf().append(self)
+
+    def _pop(self):
+        self.shelf().pop()
+
     @classmethod
     def mark(cls, title=None, *binding, **content):
         """Decorate a function to record when it start, succeeds, or fails.
@@ -39,36 +47,35 @@ class _book_compat(object):
         *binding : any
             Arguments passed directly to :class:`jotting.book`.
         **contents : any
-            Keywords passed directly to :class:`jotting.book`.
+            Keywords passed directly to :class:`jotting.book`. A
+            :class:`jotting.util.Capture` policy given as ``__capture__``
+            decides what is recorded about each call.
         """
         def setup(function):
-            cm = CallMap(function)
+            opener = cls._opener(function, title, binding, content)
             if inspect.iscoroutinefunction(function):
                 @functools.wraps(function)
                 async def author(*args, **kwargs):
-                    book = kwargs.pop("__book__", None)
-                    intro = dict(content, **cm.map(args, kwargs))
-                    with book or cls(title or function, *binding, **intro):
+                    book = kwargs.pop("__book__", None) or opener(args, kwargs)
+                    with book:
                         result = await function(*args, **kwargs)
-                        cls.conclude({"returned": result})
+                        book._returned(result)
                         return result
             elif inspect.isgeneratorfunction(function):
                 @functools.wraps(function)
                 def author(*args, **kwargs):
-                    book = kwargs.pop("__book__", None)
-                    intro = dict(content, **cm.map(args, kwargs))
-                    with book or cls(title or function, *binding, **intro):
+                    book = kwargs.pop("__book__", None) or opener(args, kwargs)
+                    with book:
                         result = function(*args, **kwargs)
-                        cls.conclude({"returned": result})
+                        book._returned(result)
                         yield from result
             else:
                 @functools.wraps(function)
                 def author(*args, **kwargs):
-                    book = kwargs.pop("__book__", None)
-                    intro = dict(content, **cm.map(args, kwargs))
-                    with book or cls(title or function, *binding, **intro):
+                    book = kwargs.pop("__book__", None) or opener(args, kwargs)
+                    with book:
                         result = function(*args, **kwargs)
-                        cls.conclude({"returned": result})
+                        book._returned(result)
                         return result
             return author
         if callable(title):
@@ -0,0 +1,50 @@
+from contextvars import ContextVar
+
+from ._book_py35 import _book_compat as _book_py35
+
+
+_current = ContextVar("jotting.book", default=None)
+
+
+class _book_compat(_book_py35):
+
+    @classmethod
+    def shelf(cls):
+        """A list of all open :class:`jotting.book`s in the current context.
+
+        Open books are tracked with a :class:`contextvars.ContextVar` so new
+        :mod:`asyncio` tasks inherit the current book automatically. Rather
+        than being kept around, this list is built each time it's requested.
+
+        Returns
+        -------
+        A list of :class:`jotting.book` objects.
+        """
+        books, now = [], _current.get()
+        while now is not None:
+            books.append(now)
+            now = now._outer
+        books.append(None)
+        books.reverse()
+        return books
+
+    @classmethod
+    def _now(cls):
+        return _current.get()
+
+    def _push(self):
+        self._outer = _current.get()
+        _current.set(self)
+
+    def _pop(self):
+        now = _current.get()
+        if now is self:
+            _current.set(self._outer)
+            return
+        # books may close out of order (e.g. a generator finished within
+        # another book) so take this one out of the chain
+        while now is not None:
+            if now._outer is self:
+                now._outer = self._outer
+                break
+            now = now._outer
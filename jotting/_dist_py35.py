@@ -0,0 +1,82 @@
+import asyncio
+from threading import Thread, Event as ThreadEvent
+
+from .dist import DistributorMixin, ThreadQueue, Empty, _copies
+from .to import AsyncOutlet
+
+
+class DistributorLoop(DistributorMixin, Thread):
+    """Deliver logs to outlets from a thread running an :mod:`asyncio` loop.
+
+    Logs sent to a :class:`jotting.to.AsyncOutlet` are delivered by separate
+    tasks, so many can be in flight at once. Other outlets are called
+    directly from the event loop, just as they would be in a thread.
+
+    Parameters
+    ----------
+    maxsize : int
+        The maximum number of items held in the inbox. If zero, there's no
+        limit. Logs sent together (e.g. by thread buffers) count as one item.
+    concurrency : int
+        The maximum number of logs that are being sent at once. Once reached,
+        no more logs are taken from the inbox until some sends finish.
+    **options : any
+        Options for :class:`DistributorMixin`.
+    """
+
+    def __init__(self, maxsize=0, concurrency=64, **options):
+        self._concurrency = concurrency
+        super(DistributorLoop, self).__init__(
+            ThreadQueue(maxsize), ThreadEvent(), **options)
+
+    def run(self):
+        loop = self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self._main())
+        finally:
+            loop.close()
+
+    async def _main(self):
+        self._slots = asyncio.Semaphore(self._concurrency)
+        self._pending = set()
+        while not self._halt.is_set():
+            while len(self._pending) >= self._concurrency:
+                await asyncio.wait(self._pending,
+                    return_when=asyncio.FIRST_COMPLETED)
+            try:
+                items = await self._loop.run_in_executor(None, self._receive)
+            except Empty:
+                self._flush()
+                continue
+            try:
+                self._send(self._unpack(items))
+                if self._dropped.value != self._reported:
+                    self._report()
+            finally:
+                for i in items:
+                    self.inbox.task_done()
+        if self._pending:
+            await asyncio.wait(self._pending)
+
+    def _deliver(self, outlet, logs, styled, shared=False):
+        if isinstance(outlet, AsyncOutlet):
+            if shared:
+                logs = _copies(logs)
+            for log in logs:
+                task = self._loop.create_task(self._sending(outlet, log))
+                self._pending.add(task)
+                task.add_done_callback(self._pending.discard)
+        else:
+            super(DistributorLoop, self)._deliver(
+                outlet, logs, styled, shared)
+
+    async def _sending(self, outlet, log):
+        async with self._slots:
+            try:
+                await outlet.send(log)
+            except Exception as error:
+                self._loop.call_exception_handler({
+                    "message": "Outlet %r failed to send a log" % outlet,
+                    "exception": error,
+                })
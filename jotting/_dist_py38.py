@@ -0,0 +1,167 @@
+import os
+import pickle
+import struct
+import weakref
+from queue import Empty, Full
+from time import sleep, monotonic
+from multiprocessing import Lock
+from multiprocessing.shared_memory import SharedMemory
+
+from .record import Record
+
+
+_position = struct.Struct("Q")
+_positions = struct.Struct("QQ")
+_length = struct.Struct("I")
+
+
+class RingQueue(object):
+    """A queue of pickled logs in a shared memory ring buffer.
+
+    Any number of processes may put logs into the queue, but only one (the
+    collector) may get them out. Producers hold a lock only while copying a
+    log into the buffer, and the collector takes it just once each time it
+    catches up with them. Records are pickled as plain tuples, which is
+    several times faster than pickling the records themselves. Since the
+    buffer has a fixed capacity, putting a log may raise
+    :class:`queue.Full` - see the ``overflow`` policies of
+    :class:`jotting.dist.DistributorMixin` for how to handle this. Logs too
+    big to ever fit in the buffer raise :class:`queue.Full` straight away.
+
+    Parameters
+    ----------
+    capacity : int
+        The size of the buffer in bytes.
+    """
+
+    # the buffer starts with the total bytes written (head), and read (tail)
+    _offset = _position.size * 2
+
+    def __init__(self, capacity=2 ** 24):
+        self._capacity = capacity
+        self._memory = SharedMemory(create=True, size=self._offset + capacity)
+        self._buf = self._memory.buf
+        self._buf[:self._offset] = bytes(self._offset)
+        self._lock = Lock()
+        self._head = self._tail = 0
+        self._finalizer = weakref.finalize(
+            self, _release, self._memory, os.getpid())
+
+    def put(self, item, block=True, timeout=None):
+        data = pickle.dumps(_encode(item), pickle.HIGHEST_PROTOCOL)
+        data = _length.pack(len(data)) + data
+        size = len(data)
+        if size > self._capacity:
+            # waiting won't help
+            raise Full()
+        deadline = None if timeout is None else monotonic() + timeout
+        delay = 0.0001
+        while True:
+            with self._lock:
+                head, tail = self._positions()
+                if self._capacity - (head - tail) >= size:
+                    self._copy(head, data)
+                    _position.pack_into(self._buf, 0, head + size)
+                    return
+            if not block or (deadline is not None and monotonic() >= deadline):
+                raise Full()
+            sleep(delay)
+            delay = min(delay * 2, 0.05)
+
+    def put_nowait(self, item):
+        return self.put(item, block=False)
+
+    def get(self, block=True, timeout=None):
+        """Get the next log - only the collector process should call this."""
+        deadline = None if timeout is None else monotonic() + timeout
+        delay = 0.0001
+        while self._tail == self._head:
+            with self._lock:
+                self._head = self._positions()[0]
+            if self._tail != self._head:
+                break
+            if not block or (deadline is not None and monotonic() >= deadline):
+                raise Empty()
+            sleep(delay)
+            delay = min(delay * 2, 0.05)
+        size = _length.unpack(self._read(self._tail, _length.size))[0]
+        data = self._read(self._tail + _length.size, size)
+        self._tail += _length.size + size
+        # let producers reuse the space
+        _position.pack_into(self._buf, _position.size, self._tail)
+        return _decode(pickle.loads(data))
+
+    def get_nowait(self):
+        return self.get(block=False)
+
+    def task_done(self):
+        pass
+
+    def empty(self):
+        with self._lock:
+            head, tail = self._positions()
+        return head == tail
+
+    def join(self):
+        while not self.empty():
+            sleep(0.01)
+
+    def _positions(self):
+        return _positions.unpack_from(self._buf, 0)
+
+    def _copy(self, position, data):
+        """Copy data into the buffer, wrapping around its end."""
+        start = self._offset + position % self._capacity
+        stop = start + len(data)
+        end = self._offset + self._capacity
+        if stop <= end:
+            self._buf[start:stop] = data
+        else:
+            split = end - start
+            self._buf[start:end] = data[:split]
+            self._buf[self._offset:self._offset + len(data) - split] = data[split:]
+
+    def _read(self, position, size):
+        """Read data from the buffer, wrapping around its end."""
+        start = self._offset + position % self._capacity
+        stop = start + size
+        end = self._offset + self._capacity
+        if stop <= end:
+            return self._buf[start:stop].tobytes()
+        split = end - start
+        return (self._buf[start:end].tobytes()
+            + self._buf[self._offset:self._offset + size - split].tobytes())
+
+    def __getstate__(self):
+        return {"name": self._memory.name, "capacity": self._capacity,
+            "lock": self._lock, "head": self._head, "tail": self._tail}
+
+    def __setstate__(self, state):
+        self._capacity = state["capacity"]
+        self._memory = SharedMemory(name=state["name"])
+        self._buf = self._memory.buf
+        self._lock = state["lock"]
+        self._head, self._tail = state["head"], state["tail"]
+        self._finalizer = weakref.finalize(self, self._memory.close)
+
+
+def _encode(item):
+    if isinstance(item, Record):
+        return item.to_tuple()
+    elif isinstance(item, list):
+        return [l.to_tuple() if isinstance(l, Record) else l for l in item]
+    return item
+
+
+def _decode(item):
+    if isinstance(item, tuple):
+        return Record.from_tuple(item)
+    elif isinstance(item, list):
+        return [Record.from_tuple(l) if isinstance(l, tuple) else l for l in item]
+    return item
+
+
+def _release(memory, owner):
+    memory.close()
+    if os.getpid() == owner:
+        memory.unlink()
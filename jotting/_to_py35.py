@@ -0,0 +1,67 @@
+import asyncio
+
+from .to import Outlet
+
+
+class AsyncOutlet(Outlet):
+    """A base class for outlets whose handler is a coroutine.
+
+    Subclasses should override the :meth:`_handler` coroutine. When used with
+    a :class:`jotting.dist.DistributorLoop` many logs may be sent at once, so
+    a slow round trip (e.g. to a database or server) does not hold up the
+    delivery of other logs. Other distributors run the coroutines to
+    completion themselves, one batch at a time.
+
+    Parameters
+    ----------
+    style : callable
+        A function that returns a formated log string.
+    *args : any
+        Positional arguments passed to :meth:`AsyncOutlet._handler`.
+    **kwargs : any
+        Keyword arguments passed to :meth:`AsyncOutlet._handler`.
+    """
+
+    _loop = None
+
+    async def send(self, log):
+        """Format a log, and send it wherever it needs to go."""
+        log = self._format(log)
+        if log is not None:
+            await self._handler(log, *self._args, **self._kwargs)
+
+    async def send_batch(self, logs):
+        """Send a batch of logs concurrently."""
+        await asyncio.gather(*map(self.send, logs))
+
+    def __call__(self, log):
+        self._run(self.send(log))
+
+    def handle_styled(self, texts):
+        self._run(self._handle_styled(texts))
+
+    async def _handle_styled(self, texts):
+        await asyncio.gather(*[self._handler(
+            t, *self._args, **self._kwargs) for t in texts])
+
+    def _run(self, coroutine):
+        """Run a coroutine to completion outside of an event loop."""
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop.run_until_complete(coroutine)
+
+    async def _handler(self, log, *args, **kwargs):
+        """Send logs wherever they need to go.
+
+        This coroutine should be overriden in a subclasses.
+
+        Parameters
+        ----------
+        log : str
+            A formated log string.
+        *args : any
+            Positional arguments used to initialize the Outlet.
+        **kwargs : any
+            Keyword arguments used to initialize the Outlet.
+        """
+        raise NotImplementedError()
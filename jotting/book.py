@@ -6,14 +6,18 @@ import types
 import inspect
 import threading
 import functools
-from uuid import uuid4
+from random import random
 from weakref import WeakKeyDictionary
 
-from .util import to_title
-from .dist import DistributorThread
+from .util import (to_title, is_template, CallMap, Tags,
+    usage, usage_since)
+from .record import Header, Record
+from .dist import DistributorThread, ProducerBuffers
 from . import to, style, read
 
-if sys.version_info >= (3, 5):
+if sys.version_info >= (3, 7):
+    from ._book_py37 import _book_compat
+elif sys.version_info >= (3, 5):
     from ._book_py35 import _book_compat
 else:
     from ._book_py27 import _book_compat
@@ -36,33 +40,216 @@ class book(_book_compat):
         manually communicate this.
     **content : any
         A dictionary of content that will be logged when the book is opened.
+
+    Notes
+    -----
+    When :meth:`book.sample` is used to record only some books, unsampled
+    books are given the tag ``book.unsampled``. Their children, even those
+    linked to them across threads or processes, are unsampled as well.
+
+    Subclasses which override ``__init__`` should pass their ``**content``
+    along to it - :meth:`book.mark` gives the title it has already worked
+    out as ``__title__``.
     """
 
+    unsampled = "unsampled"
+
     _shelves = WeakKeyDictionary()
     _distributor_type = DistributorThread
+    _distributor_options = {}
     _distributor_inst = DistributorThread()
+    _buffers = None
+    _sample_rate = 1.0
+    _sample_rates = {}
+    _capture = None
+    _measure = False
+    _new_tag = Tags()
 
     def __init__(self, title, parent=None, **content):
-        title = to_title(title, content)
+        title = content.pop("__title__", None) or to_title(title, content)
+        self._open(title, parent, content)
+
+    def _open(self, title, parent, content):
         parent = parent or self.current("tag")
+        if parent is None:
+            rate = self._sample_rates.get(title, self._sample_rate)
+            self._sampled = rate >= 1 or random() < rate
+        else:
+            self._sampled = parent != self.unsampled
         self._opening = content
         self._conclusion = {}
-        self._metadata = {
-            "title": title,
-            "timestamps": (),
-            "tag": uuid4().hex,
-            "parent": parent,
-        }
+        tag = self._new_tag() if self._sampled else self.unsampled
+        self._header = Header(title, tag, parent)
+        self._status = self._start = None
+
+    @classmethod
+    def _opener(cls, function, title, binding, content):
+        """Create a function which opens a book for calls to a marked function.
+
+        The title, and a mapping of arguments onto the function's signature,
+        are worked out up front so calls to the function need not repeat them.
+
+        Returns
+        -------
+        callable
+            A function of the form ``(args, kwargs) -> book``.
+        """
+        content = dict(content)
+        capture = content.pop("__capture__", None)
+        cm = CallMap(function)
+        mapper = cm.compile(content)
+        parent = binding[0] if binding else None
+        template = title if isinstance(title, str) and is_template(title) else None
+        fixed = None if template else to_title(title or function, {})
+        init = getattr(cls.__init__, "__func__", cls.__init__)
+        custom = init is not _init
+
+        def opener(args, kwargs):
+            try:
+                intro = mapper(*args, **kwargs)
+            except TypeError:
+                # let the function itself complain about its arguments
+                intro = dict(content, **cm.map(args, kwargs))
+            resolved = fixed if template is None else template.format(**intro)
+            if custom:
+                # subclasses may do more when they're initialized
+                self = cls(title or function, *binding,
+                    __title__=resolved, **intro)
+            else:
+                self = cls.__new__(cls)
+                self._open(resolved, parent, intro)
+            policy = self._capture = capture or cls._capture
+            if policy is not None and self._sampled:
+                self._opening = policy.arguments(intro, content)
+            return self
+
+        if mapper is None:
+            def mapper(*args, **kwargs):
+                return dict(content, **cm.map(args, kwargs))
+
+        return opener
+
+    @classmethod
+    def capture(cls, policy=None):
+        """Set what :meth:`book.mark` records about calls by default.
+
+        A policy can also be given to individual decorators with the
+        ``__capture__`` keyword (e.g. ``book.mark(__capture__=policy)``).
+
+        Parameters
+        ----------
+        policy : :class:`jotting.util.Capture` or None
+            The policy to use. If ``None`` then arguments and return values
+            are recorded as they are.
+        """
+        cls._capture = policy
+
+    @classmethod
+    def tagging(cls, generator=None):
+        """Set how tags are created for new books.
+
+        Parameters
+        ----------
+        generator : callable or None
+            A function which returns a new, unique, string each time it's
+            called (e.g. ``lambda: uuid.uuid4().hex``). If ``None`` then a
+            :class:`jotting.util.Tags` generator is used.
+        """
+        cls._new_tag = staticmethod(generator or Tags())
+
+    @classmethod
+    def measure(cls, enabled=True):
+        """Record the resources each book uses in its closing log.
+
+        This includes the elapsed time according to a monotonic clock, the
+        CPU time of the thread, and (on Linux) the number of voluntary and
+        involuntary context switches. Comparing these can tell whether a book
+        was slow because it was computing, or because it was waiting. Since
+        they are measured in the thread which opened the book, they include
+        the work of other coroutines run in that thread in the meantime.
+
+        Parameters
+        ----------
+        enabled : bool
+            Whether to measure resource usage.
+        """
+        cls._measure = enabled
+
+    @classmethod
+    def sample(cls, rate=1.0, titles=None):
+        """Only record a fraction of books.
+
+        The decision is made once for each root book (one without a parent),
+        and applies to all its children. Unsampled books cost very little,
+        since they are never sent to outlets.
+
+        Parameters
+        ----------
+        rate : float
+            The fraction of root books, between 0 and 1, that are recorded.
+        titles : dict or None
+            A mapping of titles to the rate for root books with that title.
+        """
+        cls._sample_rate = rate
+        cls._sample_rates = dict(titles or {})
 
     @classmethod
     def distribute(cls, *outlets):
         """Set which :class:`jotting.to.Outlet` objects recieve logs."""
         cls._distributor_inst.set_outlets(*outlets)
 
+    @classmethod
+    def configure(cls, distributor=None, buffer=0, interval=0.05, **options):
+        """Replace the distributor which delivers logs to outlets.
+
+        Parameters
+        ----------
+        distributor : type or None
+            A distributor type from :mod:`jotting.dist`. If ``None`` then the
+            current type of distributor is used.
+        buffer : int
+            If greater than zero, each thread buffers this many logs before
+            sending them to the distributor at once. This avoids contention
+            between threads which write many logs. Each chunk of logs counts
+            as a single item towards the ``maxsize`` of the distributor.
+        interval : float
+            The number of seconds after which partially filled thread buffers
+            are sent to the distributor anyway.
+        **options : any
+            Keyword arguments for the distributor (e.g. ``batch``, ``latency``,
+            ``maxsize`` or ``overflow``). These are reused whenever it is
+            restarted.
+        """
+        if distributor is not None:
+            cls._distributor_type = distributor
+        cls._distributor_options = options
+        old = cls._distributor_inst
+        new = cls._distributor_type(**options)
+        new.set_outlets(*cls.outlets())
+        cls._distributor_inst = new
+        if cls._buffers is not None:
+            cls._buffers.stop()
+        if buffer > 0:
+            cls._buffers = ProducerBuffers(cls._distribute_batch, buffer, interval)
+        else:
+            cls._buffers = None
+        if old.is_alive():
+            # deliver the logs still queued for the old distributor
+            old.handoff(new)
+
+    @classmethod
+    def dropped(cls):
+        """Get how many logs the current distributor has dropped.
+
+        Logs are only dropped when the distributor is configured with a
+        ``maxsize`` and an ``overflow`` policy which permits it.
+        """
+        return cls._distributor_inst.dropped()
+
     @property
     def tag(self):
         """Get this book's tag."""
-        return self._metadata['tag']
+        return self._header.tag
 
     @property
     def status(self):
@@ -73,12 +260,16 @@ class book(_book_compat):
         string
             'started', 'working', 'success', or 'failure'.
         """
-        return self._metadata["status"]
+        return self._status
 
     @property
     def metadata(self):
         """Get a copy of this book's metadata."""
-        return self._metadata.copy()
+        metadata = dict(zip(self._header._fields, self._header))
+        if self._status is not None:
+            metadata["status"] = self._status
+            metadata["timestamps"] = (self._start,)
+        return metadata
 
     @classmethod
     def write(cls, *args, **kwargs):
@@ -107,22 +298,33 @@ class book(_book_compat):
         :class:`book`
             The current book, or an entry in its metadata.
         """
-        now = cls.shelf()[-1]
+        now = cls._now()
         if data is None:
             return now
         elif now is not None:
-            return now._metadata.get(data)
+            if data in Header._fields:
+                return getattr(now._header, data)
+            return now.metadata.get(data)
 
     @classmethod
     def outlets(cls):
         """Get the outlets for all books."""
         return cls._distributor_inst._outlets
 
+    def _returned(self, result):
+        """Conclude with a value returned by a marked function."""
+        if self._sampled:
+            policy = self._capture
+            if policy is None:
+                self._conclusion["returned"] = result
+            elif policy.returns:
+                self._conclusion["returned"] = policy.value(result)
+
     def _write(self, content):
         """Send a message with the given content to the distributor."""
-        self._metadata["timestamps"] += (time.time(),)
-        msg = {"metadata": self._metadata.copy(), "content": content}
-        self._distribute(msg)
+        if self._sampled:
+            self._distribute(Record(self._header, self._status,
+                self._start, time.time(), content))
 
     @classmethod
     def _distribute(cls, msg):
@@ -134,46 +336,67 @@ class book(_book_compat):
 
         Parameters
         ----------
-        msg : dictionary
-            An pickleable dictionary containing data that the distributor's
-            outlets know how to handle and format.
+        msg : :class:`jotting.record.Record`
+            A pickleable record that the distributor's outlets know how to
+            handle and format.
         """
+        if cls._buffers is not None:
+            return cls._buffers.append(msg)
+        return cls._distributor().send(msg)
+
+    @classmethod
+    def _distribute_batch(cls, msgs):
+        """Pushes a list of messages to the distributor all at once."""
+        return cls._distributor().send_batch(msgs)
+
+    @classmethod
+    def _distributor(cls):
+        """Get the distributor, restarting it if it has died."""
         if not cls._distributor_inst.is_alive():
             # restart the distributor daemon
-            new = cls._distributor_type()
+            new = cls._distributor_type(**cls._distributor_options)
             new.set_outlets(*cls.outlets())
             cls._distributor_inst = new
-        return cls._distributor_inst.send(msg)
+        return cls._distributor_inst
 
     def __enter__(self):
-        self.shelf().append(self)
-        self._metadata["status"] = "started"
-        self._write(self._opening)
-        self._metadata["status"] = "working"
+        self._push()
+        self._start = time.time()
+        self._status = "started"
+        if self._sampled:
+            self._distribute(Record(self._header, "started",
+                self._start, self._start, self._opening))
+            self._usage = usage() if self._measure else None
+        self._status = "working"
         return self
 
     def __exit__(self, *exc):
-        self._metadata["stop"] = time.time()
         if exc[0] is not None:
             etype = exc[0].__name__
-            self._metadata["status"] = "failure"
+            self._status = "failure"
             self._conclusion[etype] = str(exc[1])
         else:
-            self._metadata["status"] = "success"
-        self._write(self._conclusion)
-        self.shelf().pop()
+            self._status = "success"
+        if self._sampled:
+            used = usage_since(self._usage) if self._usage else None
+            self._distribute(Record(self._header, self._status,
+                self._start, time.time(), self._conclusion, used))
+        self._pop()
         return False
 
     def __len__(self):
-        return len(self._metadata)
+        return len(self.metadata)
 
     def __iter__(self):
-        return iter(self._metadata)
+        return iter(self.metadata)
 
     def __getitem__(self, key):
-        return self._metadata[key]
+        return self.metadata[key]
 
     def __repr__(self):
         name = type(self).__name__
-        data = map(lambda i: "%s=%s" % i, self._metadata.items())
+        data = map(lambda i: "%s=%s" % i, self.metadata.items())
         return "%s(%s)" % (name, ", ".join(data))
+
+
+_init = getattr(book.__init__, "__func__", book.__init__)
@@ -1,31 +1,80 @@
 import os
 import sys
 import json
+import atexit
+import threading
 from time import time as now
 from multiprocessing import (
-    Process, JoinableQueue as ProcessQueue, Event as ProcessEvent)
+    Process, JoinableQueue as ProcessQueue, Event as ProcessEvent, Value)
 if sys.version_info > (3, 0):
-    from queue import Queue as ThreadQueue
+    from queue import Queue as ThreadQueue, Empty, Full
 else:
-    from Queue import Queue as ThreadQueue
+    from Queue import Queue as ThreadQueue, Empty, Full
 from threading import Thread, Event as ThreadEvent
 
-from .util import Switch
+from .util import Switch, Tags
+from .to import Outlet
+from .record import Header, Record
 
 
 class DistributorMixin(object):
+    """Deliver logs from an inbox to outlets in a background worker.
 
-    def __init__(self, inbox, stop):
+    Parameters
+    ----------
+    inbox : joinable queue
+        The queue that logs are sent through.
+    stop : event
+        An event which, once set, stops the distributor.
+    batch : int
+        The maximum number of logs handed to outlets at once.
+    latency : float
+        How many seconds to wait for a batch to fill up before sending it
+        along. By default, only logs that are already queued are collected.
+    idle : float
+        After this many seconds without any logs, outlets are flushed.
+    overflow : string
+        What to do when a bounded inbox is full:
+
+        - ``"block"``: wait up to ``timeout`` seconds for space, then drop the log.
+        - ``"drop_newest"``: drop the log being sent.
+        - ``"drop_oldest"``: drop the oldest queued log to make room.
+        - ``"keep_critical"``: block for "started" and "failure" logs, drop the rest.
+
+        Dropped logs are counted, and reported to outlets with a log titled
+        ``"jotting.dropped"``.
+    timeout : float or None
+        How long the ``"block"`` and ``"keep_critical"`` policies wait for
+        space. If ``None`` they wait forever.
+    """
+
+    policies = ("block", "drop_newest", "drop_oldest", "keep_critical")
+
+    # whether to wait for the first log before starting
+    _lazy = False
+
+    def __init__(self, inbox, stop, batch=512, latency=0.0, idle=1.0,
+            overflow="block", timeout=None):
         super(DistributorMixin, self).__init__()
         for attr in ("join", "get", "put", "task_done"):
             if not hasattr(inbox, attr):
                 raise TypeError("Expected some type of joinable"
                     " queue that implements %r." % attr)
+        if overflow not in self.policies:
+            raise ValueError("Unknown overflow policy %r" % overflow)
         self.inbox = inbox
         self.daemon = True
         self._outlets = ()
-        self._stop = stop
-        self.start()
+        self._halt = stop
+        self._batch = max(batch, 1)
+        self._latency = latency
+        self._idle = idle
+        self._overflow = overflow
+        self._timeout = timeout
+        self._dropped = self._counter()
+        self._reported = 0
+        if not self._lazy:
+            self.start()
 
     def set_outlets(self, *outlets):
         """Set which callable outlets will recieve logged messages."""
@@ -33,7 +82,21 @@ class DistributorMixin(object):
 
     def send(self, log):
         """Send a picklable message to outlets."""
-        self.inbox.put(log)
+        try:
+            self.inbox.put_nowait(log)
+        except Full:
+            self._overflowed(log)
+
+    def send_batch(self, logs):
+        """Send a list of picklable messages to outlets all at once."""
+        try:
+            self.inbox.put_nowait(logs)
+        except Full:
+            self._overflowed(logs)
+
+    def dropped(self):
+        """Get the number of logs dropped because the inbox was full."""
+        return self._dropped.value
 
     def deadline(self, timeout):
         """Give the distributor time to flush logs before stopping."""
@@ -45,33 +108,424 @@ class DistributorMixin(object):
                 self.stop()
                 break
 
+    def handoff(self, other):
+        """Stop the distributor, and send the logs left in its inbox to another.
+
+        The batch currently being delivered is finished first, so logs still
+        reach outlets in order.
+        """
+        self.stop()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+        while True:
+            try:
+                item = self.inbox.get_nowait()
+            except Empty:
+                break
+            self.inbox.task_done()
+            if isinstance(item, list):
+                other.send_batch(item)
+            elif item is not None:
+                other.send(item)
+
     def stop(self):
         """Stop the distributor without flushing logs"""
-        self._stop.set()
+        self._halt.set()
+        # wake the distributor if it's waiting on an empty inbox
+        try:
+            self.inbox.put_nowait(None)
+        except Full:
+            pass
 
     def run(self):
-        while not self._stop.is_set():
-            log = self.inbox.get()
+        while not self._halt.is_set():
+            try:
+                items = self._receive()
+            except Empty:
+                self._flush()
+                continue
             try:
-                self._send(log)
+                self._send(self._unpack(items))
+                if self._dropped.value != self._reported:
+                    self._report()
             except:
                 raise
             finally:
-                self.inbox.task_done()
+                for i in items:
+                    self.inbox.task_done()
+
+    def _receive(self):
+        """Drain a batch of items (logs, or lists of logs) from the inbox.
+
+        Waits up to ``idle`` seconds for something to arrive, then collects
+        whatever else is queued - waiting no more than ``latency`` seconds -
+        until the batch is full.
+        """
+        items = [self.inbox.get(timeout=self._idle)]
+        size = _size(items[0])
+        deadline = now() + self._latency
+        while size < self._batch:
+            remaining = deadline - now()
+            try:
+                if remaining > 0:
+                    item = self.inbox.get(timeout=remaining)
+                else:
+                    item = self.inbox.get_nowait()
+            except Empty:
+                break
+            items.append(item)
+            size += _size(item)
+        return items
+
+    @staticmethod
+    def _unpack(items):
+        """Flatten queued items into a list of logs."""
+        logs = []
+        for i in items:
+            if isinstance(i, list):
+                logs.extend(i)
+            elif i is not None:
+                logs.append(i)
+        return logs
+
+    def _send(self, logs):
+        """Call outlets with the given batch of log messages.
+
+        Outlets that share a style (see :meth:`jotting.to.Outlet.style_key`)
+        are handed the same formatted logs, so each is only formatted once,
+        unless they override ``handle_batch``. Other outlets with a
+        ``handle_batch`` method recieve the whole batch, while any other
+        callable is called once per log. Every outlet, or group of outlets
+        sharing a style, is given its own copy of the logs (except the last)
+        so changes one makes to a log are never seen by the others.
+        """
+        styled = {}
+        last = len(self._outlets) - 1
+        for i, o in enumerate(self._outlets):
+            self._deliver(o, logs, styled, i != last)
+
+    def _deliver(self, outlet, logs, styled, shared=False):
+        """Hand a batch of log messages to one outlet.
 
-    def _send(self, log):
-        """Call outlets with the given log message."""
+        Logs formatted for an outlet are kept in ``styled`` by style key. If
+        the logs are ``shared`` with outlets after this one, the outlet is
+        given copies of them.
+        """
+        key = None
+        if _formats_batches(outlet):
+            key = outlet.style_key()
+        if key is not None:
+            texts = styled.get(key)
+            if texts is None:
+                if shared:
+                    logs = _copies(logs)
+                texts = styled[key] = outlet.format_batch(logs)
+            if texts:
+                outlet.handle_styled(texts)
+            return
+        if shared:
+            logs = _copies(logs)
+        handle_batch = getattr(outlet, "handle_batch", None)
+        if handle_batch is not None:
+            handle_batch(logs)
+        else:
+            for l in logs:
+                outlet(l)
+
+    def _overflowed(self, item):
+        """Apply the overflow policy to an item that didn't fit in the inbox."""
+        policy = self._overflow
+        if policy == "drop_oldest":
+            while True:
+                try:
+                    old = self.inbox.get_nowait()
+                except Empty:
+                    pass
+                else:
+                    self.inbox.task_done()
+                    self._drop(_size(old))
+                try:
+                    return self.inbox.put_nowait(item)
+                except Full:
+                    continue
+        elif policy == "keep_critical":
+            if isinstance(item, list):
+                kept = [l for l in item if _critical(l)]
+                self._drop(len(item) - len(kept))
+                if not kept:
+                    return
+                item = kept
+            elif not _critical(item):
+                return self._drop(1)
+        if policy != "drop_newest":
+            try:
+                return self.inbox.put(item, timeout=self._timeout)
+            except Full:
+                pass
+        self._drop(_size(item))
+
+    def _counter(self):
+        """Make the count of dropped logs."""
+        return _Counter()
+
+    def _drop(self, count):
+        with self._dropped.get_lock():
+            self._dropped.value += count
+
+    def _report(self):
+        """Tell outlets how many logs have been dropped since the last report."""
+        dropped = self._dropped.value
+        count, self._reported = dropped - self._reported, dropped
+        header, time = Header("jotting.dropped", _new_tag(), None), now()
+        content = {"dropped": count, "overflow": self._overflow}
+        self._send([Record(header, "started", time, time, {}),
+            Record(header, "failure", time, time, content)])
+
+    def _flush(self):
+        """Tell outlets holding on to logs to send them along."""
         for o in self._outlets:
-            o(log)
+            flush = getattr(o, "flush", None)
+            if flush is not None:
+                flush()
 
 
-class DistributorProcess(DistributorMixin, Process):
+_new_tag = Tags()
+
+
+class _Counter(object):
+    """A count shared by threads, like a :class:`multiprocessing.Value`."""
 
     def __init__(self):
-        super(DistributorProcess, self).__init__(ProcessQueue(), ProcessEvent())
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def get_lock(self):
+        return self._lock
+
+
+def _copies(logs):
+    return [l.copy() if isinstance(l, Record) else l for l in logs]
+
+
+def _formats_batches(outlet):
+    """Whether an outlet leaves batches to :meth:`jotting.to.Outlet.handle_batch`."""
+    if not isinstance(outlet, Outlet):
+        return False
+    method = type(outlet).handle_batch
+    return getattr(method, "__func__", method) is _handle_batch
+
+
+_handle_batch = getattr(Outlet.handle_batch, "__func__", Outlet.handle_batch)
+
+
+def _size(item):
+    """The number of logs in a queued item."""
+    if isinstance(item, list):
+        return len(item)
+    return 0 if item is None else 1
+
+
+def _critical(log):
+    return log.status in ("started", "failure")
+
+
+class ProducerBuffers(object):
+    """Collect logs in per-thread buffers which are sent along in chunks.
+
+    Appending to a buffer takes no locks, so threads writing many logs don't
+    contend with one another. A thread's logs stay in order, but the logs of
+    different threads may be interleaved a chunk at a time.
+
+    Parameters
+    ----------
+    send : callable
+        A function that sends a list of logs to a distributor.
+    size : int
+        How many logs a thread buffers before sending them.
+    interval : float
+        How many seconds may pass before partially filled buffers are sent.
+    """
+
+    def __init__(self, send, size=256, interval=0.05):
+        self._send = send
+        self._size = size
+        self._interval = interval
+        self._halt = ThreadEvent()
+        self._forked()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._forked)
+        atexit.register(self.flush)
+
+    def append(self, log):
+        """Add a log to the current thread's buffer."""
+        try:
+            buffer = self._local.buffer
+        except AttributeError:
+            buffer = self._local.buffer = self._new()
+        buffer.append(log)
+        if len(buffer) >= self._size:
+            buffer.flush()
+
+    def flush(self):
+        """Send along the logs in every thread's buffer."""
+        with self._lock:
+            buffers = list(self._buffers)
+        for b in buffers:
+            b.flush()
+
+    def stop(self):
+        """Send along the buffered logs, and stop the timer thread."""
+        self._halt.set()
+        # threads still appending to these buffers send their logs at once
+        self._size = 1
+        self.flush()
+        if hasattr(atexit, "unregister"):
+            atexit.unregister(self.flush)
+
+    def _new(self):
+        buffer = _Buffer(self._send)
+        with self._lock:
+            self._buffers.append(buffer)
+            if self._timer is None:
+                self._timer = Thread(target=self._run)
+                self._timer.daemon = True
+                self._timer.start()
+        return buffer
+
+    def _run(self):
+        while not self._halt.wait(self._interval):
+            self.flush()
+            with self._lock:
+                # forget the buffers of threads which have finished
+                self._buffers = [b for b in self._buffers
+                    if b or b.thread.is_alive()]
+
+    def _forked(self):
+        """Discard buffers inherited from a parent process."""
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._buffers = []
+        self._timer = None
+
+
+class _Buffer(list):
+    """A list of logs belonging to one thread."""
+
+    __slots__ = ("send", "lock", "thread")
+
+    def __init__(self, send):
+        self.send = send
+        self.lock = threading.Lock()
+        self.thread = threading.current_thread()
+
+    def flush(self):
+        with self.lock:
+            size = len(self)
+            if size:
+                chunk = self[:size]
+                # the owning thread may have appended more in the meantime
+                del self[:size]
+                self.send(chunk)
+
+
+class DistributorProcess(DistributorMixin, Process):
+    """Deliver logs to outlets in a seperate process.
+
+    The process is started once the first log is sent, so outlets must be
+    set before then. Processes forked from the one which created the
+    distributor send their logs to the same collector process.
+
+    Parameters
+    ----------
+    maxsize : int
+        The maximum number of items held in the inbox. If zero, there's no
+        limit. Logs sent together (e.g. by thread buffers) count as one item.
+    transport : string
+        How logs get to the collector process. Either a ``"queue"`` which
+        uses a :class:`multiprocessing.JoinableQueue`, or a ``"ring"`` which
+        uses a much faster :class:`jotting.dist.RingQueue` in shared memory
+        (requires Python 3.8 or later). A ring is bounded by its ``capacity``
+        in bytes rather than ``maxsize``, and doesn't support the
+        ``"drop_oldest"`` overflow policy.
+    capacity : int
+        The size in bytes of a ``"ring"``.
+    **options : any
+        Options for :class:`DistributorMixin`.
+    """
+
+    _lazy = True
+
+    def __init__(self, maxsize=0, transport="queue", capacity=2 ** 24, **options):
+        if transport == "ring":
+            if sys.version_info < (3, 8):
+                raise ValueError("A ring transport requires Python 3.8 or later.")
+            if options.get("overflow") == "drop_oldest":
+                raise ValueError("A ring transport can't drop its oldest logs.")
+            inbox = RingQueue(capacity)
+        elif transport == "queue":
+            inbox = ProcessQueue(maxsize)
+        else:
+            raise ValueError("Unknown transport %r" % transport)
+        self._creator = os.getpid()
+        self._launched = False
+        super(DistributorProcess, self).__init__(
+            inbox, ProcessEvent(), **options)
+
+    def send(self, log):
+        if not self._launched:
+            self._launch()
+        super(DistributorProcess, self).send(log)
+
+    def _counter(self):
+        # producers forked from the creator drop logs too
+        return Value("L", 0)
+
+    def send_batch(self, logs):
+        if not self._launched:
+            self._launch()
+        super(DistributorProcess, self).send_batch(logs)
+
+    def is_alive(self):
+        if os.getpid() != self._creator:
+            # we're a producer forked from the creator of the collector
+            return not self._halt.is_set()
+        return not self._launched or super(DistributorProcess, self).is_alive()
+
+    def handoff(self, other):
+        """Wait for the collector to deliver the logs in its inbox, then stop it.
+
+        Logs are left to the collector since only it may read from a ring.
+        """
+        if (os.getpid() == self._creator and self._launched
+                and super(DistributorProcess, self).is_alive()):
+            self.inbox.join()
+        self.stop()
+
+    def _launch(self):
+        self._launched = True
+        if os.getpid() == self._creator:
+            self.start()
 
 
 class DistributorThread(DistributorMixin, Thread):
+    """Deliver logs to outlets in a daemon thread.
 
-    def __init__(self):
-        super(DistributorThread, self).__init__(ThreadQueue(), ThreadEvent())
+    Parameters
+    ----------
+    maxsize : int
+        The maximum number of items held in the inbox. If zero, there's no
+        limit. Logs sent together (e.g. by thread buffers) count as one item.
+    **options : any
+        Options for :class:`DistributorMixin`.
+    """
+
+    def __init__(self, maxsize=0, **options):
+        super(DistributorThread, self).__init__(
+            ThreadQueue(maxsize), ThreadEvent(), **options)
+
+
+if sys.version_info >= (3, 5):
+    from ._dist_py35 import DistributorLoop
+
+if sys.version_info >= (3, 8):
+    from ._dist_py38 import RingQueue
@@ -1,7 +1,22 @@
+import io
 import os
 import json
+import glob
+import gzip
+import zlib
+import mmap
+import struct
+import heapq
+import itertools
+import fnmatch
+import tempfile
+import threading
+import collections
+import multiprocessing
 from .style import Tree
-from .util import Switch
+from .util import Switch, Summary
+from .record import Record, Packer, MAGIC, load, unpack
+from .to import segment_index
 
 
 class Complete(object):
@@ -14,121 +29,1026 @@ class Complete(object):
     you can iterate over the reordered logs (e.g. ``list(Complete(my_source))``)
     and style them yourself later.
 
+    Books whose parent is missing from the logs (e.g. because it was in an
+    older, deleted, segment) are shown at the top level, and books that were
+    never closed are shown as they are.
+
     Parameters
     ----------
     source : string or iterable containing log strings
-        If given as a string ``source`` will be interpreted as a filepath.
+        If given as a string ``source`` will be interpreted as a filepath, or
+        a glob pattern (e.g. ``"logbox.txt*"``) matching a set of files rotated
+        by :class:`jotting.to.RotatingFile`. Compressed segments, and files
+        written by :class:`jotting.to.BinaryFile`, are read transparently.
         Otherwise source should it should be a list of log strings.
+    processes : int or None
+        Decode large files with this many processes (see
+        :func:`read_parallel`). If zero, one per CPU is used.
+    spill : int or None
+        If given, at most this many logs are held in memory while reading.
+        The rest are written to a temporary file, grouped by the tree they
+        belong to, and each tree is read back and ordered on its own. Memory
+        is then bounded by the largest tree, and a small entry per book,
+        rather than the whole source. Spilled logs are stored like those of a
+        :class:`jotting.to.BinaryFile`, so their times are kept to the
+        microsecond. Otherwise every log is kept in memory.
+    """
+
+    def __init__(self, source, processes=None, spill=None):
+        self._forest = Forest() if spill is None else _Spilled(spill)
+        for log in records(source, processes):
+            self._forest.add(log)
+
+    def __iter__(self):
+        return self._forest.walk()
+
+    def __repr__(self):
+        return "".join(map(Tree(), self))
+
+
+class Forest(object):
+    """An index of books by their tag, which can be walked in tree order.
+
+    Each book is followed by its working logs and its children, ordered by
+    time, and then by its closing log. Adding all the logs, and walking
+    them, takes ``O(n log n)`` time.
     """
 
-    def __init__(self, source):
-        if isinstance(source, str):
-            path = os.path.realpath(os.path.expanduser(source))
-            with open(path, "r") as f:
-                lines = f.read().split("\n")
-                source = map(json.loads, (l for l in lines if l))
-        self._logs = self._load(source)
-
-    def _load(self, source):
-        logs, working, done = [], [], []
-        start = lambda l: l["metadata"]["timestamps"][0]
-        for l in sorted(source, key=start):
-            status = l["metadata"]["status"]
-            if status == "started":
-                logs.append(l)
-            elif status == "working":
-                working.append(l)
+    def __init__(self):
+        self._books = {}
+        self._children = {}
+        self._count = 0
+
+    def add(self, log):
+        """Add a :class:`jotting.record.Record` to the index."""
+        tag = log.tag
+        node = self._books.get(tag)
+        if node is None:
+            node = self._books[tag] = _Node(log.parent, log.start, self._count)
+            parent = None if log.parent == tag else log.parent
+            self._children.setdefault(parent, []).append(tag)
+        status = log.status
+        if status == "started":
+            node.started = log
+        elif status == "working":
+            node.working.append((log.time, self._count, log))
+        else:
+            node.closed.append((log.time, self._count, log))
+        self._count += 1
+
+    def walk(self, tags=None):
+        """Iterate over the logs of the given books, and their descendants.
+
+        If no tags are given, all the books are walked, starting from those
+        without a parent (or whose parent is unknown).
+        """
+        if tags is None:
+            books = self._books
+            tags = [t for p, c in self._children.items()
+                if p is None or p not in books for t in c]
+        stack = [iter(self._ordered(tags))]
+        while stack:
+            item = next(stack[-1], None)
+            if item is None:
+                stack.pop()
+            elif isinstance(item, Record):
+                yield item
             else:
-                done.append(l)
-        self._insert(logs, working)
-        self._insert(logs, done)
-        return logs
+                stack.append(self._items(item))
+
+    def _ordered(self, tags):
+        """Sort books by the time they started."""
+        books = self._books
+        return sorted(tags, key=lambda t: (books[t].start, books[t].order))
+
+    def _items(self, tag):
+        """Iterate over the logs of a book, and the tags of its children."""
+        books = self._books
+        node = books[tag]
+        if node.started is not None:
+            yield node.started
+        events = [(books[t].start, books[t].order, t)
+            for t in self._children.get(tag, ())]
+        events.extend(node.working)
+        events.sort(key=_order)
+        for event in events:
+            yield event[2]
+        for closed in sorted(node.closed, key=_order):
+            yield closed[2]
+
+    def __contains__(self, tag):
+        return tag in self._books
+
+    def __len__(self):
+        return len(self._books)
+
+
+class _Node(object):
+    """The logs of a single book."""
+
+    __slots__ = ("parent", "start", "order", "started", "working", "closed")
+
+    def __init__(self, parent, start, order):
+        self.parent = parent
+        self.start = start
+        self.order = order
+        self.started = None
+        self.working = []
+        self.closed = []
+
+
+def _order(event):
+    return event[:2]
+
+
+class _Spilled(object):
+    """Logs grouped by the root of their tree, which are spilled to a file.
+
+    Books whose parent hasn't been seen yet start a tree of their own, which
+    is merged into the parent's tree if it shows up later.
+    """
+
+    def __init__(self, limit):
+        self._limit = max(limit, 1)
+        self._file = tempfile.TemporaryFile()
+        self._packer = Packer()
+        # the tag of each book, mapped to a book closer to its root
+        self._roots = {}
+        self._trees = {}
+        # missing parents, and the trees waiting for them
+        self._waiting = {}
+        # trees holding logs which haven't been spilled
+        self._dirty = []
+        self._held = 0
+        self._count = 0
+
+    def add(self, log):
+        """Add a :class:`jotting.record.Record` to its tree."""
+        tag = log.tag
+        root = self._root(tag)
+        if root is None:
+            parent = None if log.parent == tag else log.parent
+            root = None if parent is None else self._root(parent)
+            if root is None:
+                root = tag
+                self._trees[tag] = _Tree(log.start, self._count)
+                if parent is not None:
+                    self._waiting.setdefault(parent, []).append(tag)
+            self._roots[tag] = root
+            for orphan in self._waiting.pop(tag, ()):
+                self._merge(orphan, root)
+        tree = self._trees[root]
+        if not tree.held:
+            self._dirty.append(tree)
+        tree.held.append(log)
+        self._count += 1
+        self._held += 1
+        if self._held >= self._limit:
+            self._spill()
+
+    def walk(self):
+        """Iterate over the logs of each tree in the order they started."""
+        trees = sorted(self._trees.values(), key=lambda t: (t.start, t.order))
+        for tree in trees:
+            forest = Forest()
+            for offset, size in tree.spilled:
+                self._file.seek(offset)
+                for log in unpack(self._file.read(size)):
+                    forest.add(log)
+            for log in tree.held:
+                forest.add(log)
+            for log in forest.walk():
+                yield log
+
+    def _root(self, tag):
+        roots = self._roots
+        root = roots.get(tag)
+        if root is None:
+            return None
+        while roots[root] != root:
+            root = roots[root]
+        roots[tag] = root
+        return root
+
+    def _merge(self, orphan, root):
+        tree, into = self._trees.pop(orphan), self._trees[root]
+        into.spilled.extend(tree.spilled)
+        if tree.held:
+            if not into.held:
+                self._dirty.append(into)
+            into.held.extend(tree.held)
+            del tree.held[:]
+        self._roots[orphan] = root
+
+    def _spill(self):
+        """Write every held log to the file, keeping track of their trees."""
+        self._file.seek(0, os.SEEK_END)
+        for tree in self._dirty:
+            if tree.held:
+                data = self._packer.pack(
+                    [(l, Packer.content(l)) for l in tree.held])
+                tree.spilled.append((self._file.tell(), len(data)))
+                self._file.write(data)
+                del tree.held[:]
+        self._dirty = []
+        self._held = 0
+
+
+class _Tree(object):
+    """The logs of a tree, and where they were spilled."""
+
+    __slots__ = ("start", "order", "held", "spilled")
+
+    def __init__(self, start, order):
+        self.start = start
+        self.order = order
+        self.held = []
+        self.spilled = []
+
 
-    def _insert(self, logs, todo):
-        index = len(logs) - 1
-        while len(todo):
+class Index(object):
+    """A sidecar index for finding books in a log file without reading all of it.
+
+    The index maps tags to the byte offsets of their logs, parents to their
+    children, titles to tags, and buckets of time to the offsets of logs
+    written in them. It's saved next to the log file (e.g. ``.logbox.txt.idx``
+    for ``logbox.txt``), and brought up to date whenever it's opened. Logs
+    appended since then are added to it, while a file that has been
+    truncated, rewritten, or rotated is indexed from scratch. Only files of
+    JSON lines can be indexed.
+
+    The sidecar is only ever appended to - each update adds an entry for
+    every new log, any titles or tags it hasn't seen before, and a marker
+    for how much of the log file is indexed. Entries after the last marker
+    (e.g. from an update that was interrupted) are written over.
+
+    Parameters
+    ----------
+    path : string
+        The log file to index.
+    bucket : float
+        The width, in seconds, of the time buckets.
+    """
+
+    version = 2
+
+    def __init__(self, path, bucket=60.0):
+        self._path = os.path.realpath(os.path.expanduser(path))
+        head, tail = os.path.split(self._path)
+        self._sidecar = os.path.join(head, "." + tail + ".idx")
+        self._bucket = bucket
+        self._clear()
+        try:
+            with open(self._sidecar, "rb") as f:
+                data = f.read()
+        except (IOError, OSError):
+            pass
+        else:
+            if data[:_index_header.size] == self._header():
+                self._load(data)
+        self.update()
+
+    def update(self):
+        """Index any logs appended to the file since the last update."""
+        stat = os.stat(self._path)
+        if stat.st_size == self._size and stat.st_mtime == self._mtime:
+            return
+        if stat.st_ino != self._inode or stat.st_size <= self._size:
+            # the file was replaced or rewritten rather than appended to
+            self._clear()
+        out = []
+        with open(self._path, "rb") as f:
+            if f.read(len(MAGIC)) == MAGIC:
+                raise ValueError("Binary log files can't be indexed.")
+            offset = self._end
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # the rest of this log hasn't been written yet
+                    break
+                if line.strip():
+                    self._add(Record.load(line.decode("utf-8")), offset, out)
+                offset += len(line)
+        self._end, self._size = offset, stat.st_size
+        self._mtime, self._inode = stat.st_mtime, stat.st_ino
+        out.append(b"U" + _index_mark.pack(
+            self._end, self._size, self._mtime, self._inode))
+        self._save(b"".join(out))
+
+    def records(self, tag):
+        """Get the logs of a book."""
+        return self._read(self._tags.get(tag, ()))
+
+    def children(self, tag):
+        """Get the tags of a book's children."""
+        return list(self._children.get(tag, ()))
+
+    def titled(self, title):
+        """Get the tags of books with the given title."""
+        return list(self._titles.get(title, ()))
+
+    def subtree(self, tag):
+        """Get the logs of a book and its descendants in tree order."""
+        forest = Forest()
+        todo = [tag]
+        while todo:
             t = todo.pop()
-            t_m = t["metadata"]
-            t_t = t_m["timestamps"][-1]
-            for i, l in enumerate(reversed(logs)):
-                l_m = l["metadata"]
-                l_t = l_m["timestamps"][-1]
-                if t_m["tag"] in (l_m["tag"], l_m["parent"]) and l_t < t_t:
-                    logs.insert(len(logs) - i, t)
+            for log in self.records(t):
+                forest.add(log)
+            todo.extend(self._children.get(t, ()))
+        return list(forest.walk([tag])) if tag in forest else []
+
+    def window(self, start, stop):
+        """Get the logs written between two times, in the order they were written."""
+        width, times = self._bucket, self._times
+        low, high = int(start // width), int(stop // width)
+        offsets = []
+        if high - low < len(times):
+            for b in range(low, high + 1):
+                offsets.extend(times.get(b, ()))
+        else:
+            for b, found in times.items():
+                if low <= b <= high:
+                    offsets.extend(found)
+        return [l for l in self._read(offsets) if start <= l.time < stop]
+
+    def _add(self, log, offset, out):
+        """Index a log, and add its entry (and any new strings) to the output."""
+        index = self._index
+        title, tag = index(log.title, out), index(log.tag, out)
+        parent = _none if log.parent is None else index(log.parent, out)
+        time = int(log.time // self._bucket)
+        out.append(b"E" + _index_entry.pack(offset, time, title, tag, parent))
+        self._entry(offset, time, title, tag, parent)
+
+    def _entry(self, offset, time, title, tag, parent):
+        strings = self._strings
+        tag = strings[tag]
+        offsets = self._tags.get(tag)
+        if offsets is None:
+            self._tags[tag] = [offset]
+            if parent != _none:
+                self._children.setdefault(strings[parent], []).append(tag)
+            self._titles.setdefault(strings[title], []).append(tag)
+        else:
+            offsets.append(offset)
+        self._times.setdefault(time, []).append(offset)
+
+    def _index(self, string, out):
+        i = self._table.get(string)
+        if i is None:
+            i = self._table[string] = len(self._strings)
+            self._strings.append(string)
+            data = string.encode("utf-8")
+            out.append(b"S" + _index_string.pack(len(data)) + data)
+        return i
+
+    def _load(self, data):
+        """Rebuild the index from the sidecar, up to its last marker."""
+        position, end = _index_header.size, len(data)
+        strings, entries, marked = [], [], None
+        while position < end:
+            kind = data[position:position + 1]
+            if kind == b"S":
+                start = position + 1 + _index_string.size
+                if start > end:
+                    break
+                position = start + _index_string.unpack_from(
+                    data, position + 1)[0]
+                if position > end:
+                    break
+                strings.append(data[start:position].decode("utf-8"))
+            elif kind == b"E":
+                if position + 1 + _index_entry.size > end:
+                    break
+                entries.append(_index_entry.unpack_from(data, position + 1))
+                position += 1 + _index_entry.size
+            elif kind == b"U":
+                if position + 1 + _index_mark.size > end:
                     break
+                marked = (position + 1 + _index_mark.size, len(strings),
+                    len(entries), _index_mark.unpack_from(data, position + 1))
+                position = marked[0]
+            else:
+                break
+        if marked is None:
+            return
+        self._written, count, total, state = marked
+        self._end, self._size, self._mtime, self._inode = state
+        self._strings = strings[:count]
+        self._table = dict((s, i) for i, s in enumerate(self._strings))
+        for offset, time, title, tag, parent in entries[:total]:
+            self._entry(offset, time, title, tag, parent)
+
+    def _read(self, offsets):
+        logs = []
+        with open(self._path, "rb") as f:
+            for offset in sorted(offsets):
+                f.seek(offset)
+                logs.append(Record.load(f.readline().decode("utf-8")))
+        return logs
+
+    def _header(self):
+        return _index_header.pack(b"JOTI", self.version, self._bucket)
+
+    def _clear(self):
+        self._end, self._size, self._mtime, self._inode = 0, -1, None, None
+        self._strings, self._table = [], {}
+        self._tags, self._children, self._titles, self._times = {}, {}, {}, {}
+        # how much of the sidecar is still good, none of it if cleared
+        self._written = None
+
+    def _save(self, data):
+        if self._written is None:
+            with open(self._sidecar, "wb") as f:
+                f.write(self._header() + data)
+            self._written = _index_header.size + len(data)
+            return
+        with open(self._sidecar, "r+b") as f:
+            # write over anything after the last marker
+            f.seek(self._written)
+            f.write(data)
+            f.truncate()
+        self._written += len(data)
+
+
+# the sidecar of an index starts with a magic number, its version, and the
+# width of its time buckets
+_index_header = struct.Struct("<4sId")
+_index_string = struct.Struct("<I")
+# the offset and time bucket of a log, with its title, tag, and parent
+_index_entry = struct.Struct("<qqIII")
+# how much of the log file was indexed - its end, size, mtime, and inode
+_index_mark = struct.Struct("<qqdQ")
+_none = 0xFFFFFFFF
+
+
+class Query(object):
+    """Select logs by their title, status, duration, time, or ancestor.
+
+    Calling a query with a source of logs yields those which match, while
+    :meth:`Query.stats` summarizes the books that match by title. Logs are
+    read in a single pass, so files of any size can be queried.
+
+    Parameters
+    ----------
+    title : string or None
+        A pattern for titles, which may contain shell-style wildcards
+        (e.g. ``"myapp.*"``).
+    status : string, iterable of strings, or None
+        The status, or statuses, of logs to select.
+    longer : float or None
+        Only select logs written at least this many seconds after their
+        book was started.
+    since : float or None
+        Only select logs written at, or after, this time.
+    until : float or None
+        Only select logs written before this time.
+    ancestor : string or None
+        Only select logs of the book with this tag, or its descendants.
+        Books must appear after their parents in the source.
+    """
+
+    def __init__(self, title=None, status=None, longer=None, since=None,
+            until=None, ancestor=None):
+        self.title = title
+        self.status = (status,) if isinstance(status, str) else status
+        self.longer = longer
+        self.since = since
+        self.until = until
+        self.ancestor = ancestor
+
+    def __call__(self, source):
+        """Iterate over the logs in a source that match this query.
+
+        The source may be anything that :class:`Complete` accepts.
+        """
+        lineage = None if self.ancestor is None else set([self.ancestor])
+        for log in records(source):
+            if lineage is not None:
+                if log.parent in lineage:
+                    lineage.add(log.tag)
+                elif log.tag not in lineage:
+                    continue
+            if self.match(log):
+                yield log
+
+    def match(self, log):
+        """Whether a log matches this query - besides its ancestor."""
+        if self.title is not None and not fnmatch.fnmatchcase(log.title, self.title):
+            return False
+        if self.status is not None and log.status not in self.status:
+            return False
+        if self.longer is not None and log.duration < self.longer:
+            return False
+        if self.since is not None and log.time < self.since:
+            return False
+        if self.until is not None and log.time >= self.until:
+            return False
+        return True
+
+    def stats(self, source, accuracy=0.01):
+        """Summarize the closed books in a source that match this query.
+
+        Returns
+        -------
+        :class:`Stats`
+        """
+        stats = Stats(accuracy)
+        for log in self(source):
+            stats.add(log)
+        return stats
+
+
+class Stats(object):
+    """A :class:`Summary` of closed books for each title.
+
+    Stats from separate sources (e.g. sharded files read in parallel
+    processes) can be combined with :meth:`Stats.merge`.
+
+    Parameters
+    ----------
+    accuracy : float
+        The relative accuracy of duration quantiles.
+    """
+
+    def __init__(self, accuracy=0.01):
+        self.accuracy = accuracy
+        self.titles = {}
+
+    def add(self, log):
+        """Count a log if it closes a book."""
+        if log.status in ("success", "failure"):
+            summary = self.titles.get(log.title)
+            if summary is None:
+                summary = self.titles[log.title] = Summary(self.accuracy)
+            summary.add(log)
+
+    def merge(self, other):
+        """Add the books counted by other stats to these ones."""
+        for title, summary in other.titles.items():
+            if title in self.titles:
+                self.titles[title].merge(summary)
             else:
-                raise ValueError("Incomplete log set.")
+                self.titles[title] = Summary(self.accuracy).merge(summary)
+        return self
+
+    def to_dict(self):
+        """Get a dictionary of each title's summary as a dictionary."""
+        return dict((t, s.to_dict()) for t, s in self.titles.items())
+
+    def __getitem__(self, title):
+        return self.titles[title]
 
     def __iter__(self):
-        return iter(self._logs)
+        return iter(self.titles)
+
+    def __len__(self):
+        return len(self.titles)
+
+
+class Follow(object):
+    """Follow a log file as it grows, sending new logs to outlets.
+
+    The file is polled for new lines, waiting longer between polls while
+    nothing is written, up to some maximum. New logs go through a
+    :class:`Stream` so they reach outlets in tree order. How far the file
+    has been read is saved in a checkpoint next to it (e.g.
+    ``.logbox.txt.follow`` for ``logbox.txt``) so a new follower can pick
+    up where the last left off. A rotated file is read to its end before
+    moving on to the new one, and a truncated file is read from the start.
+    Only files of JSON lines can be followed.
+
+    Parameters
+    ----------
+    path : string
+        The log file to follow.
+    *outlets : callable
+        Outlets which recieve logs one at a time.
+    interval : float
+        The shortest time, in seconds, between polls.
+    maximum : float
+        The longest time, in seconds, between polls.
+    checkpoint : bool
+        Whether to save and resume from a checkpoint.
+    watermark : float
+        The ``watermark`` of the :class:`Stream`.
+    """
+
+    def __init__(self, path, *outlets, **options):
+        self._path = os.path.realpath(os.path.expanduser(path))
+        self._interval = options.pop("interval", 0.1)
+        self._maximum = options.pop("maximum", 5.0)
+        checkpoint = options.pop("checkpoint", True)
+        self._stream = Stream(*outlets, watermark=options.pop("watermark", 0.0))
+        if options:
+            raise TypeError("Unexpected options %s" % ", ".join(options))
+        head, tail = os.path.split(self._path)
+        self._checkpoint = os.path.join(head, "." + tail + ".follow") if checkpoint else None
+        self._halt = threading.Event()
+        self._file = None
+        self._inode = None
+        self._offset = 0
+        self._partial = b""
+        self._resume = None
+        if self._checkpoint is not None:
+            try:
+                with open(self._checkpoint, "r") as f:
+                    self._resume = json.load(f)
+            except (IOError, OSError, ValueError):
+                pass
+
+    def poll(self):
+        """Read the logs written since the last poll.
+
+        Returns
+        -------
+        int
+            The number of logs that were read.
+        """
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            stat = None
+        count = 0
+        if self._file is not None and (stat is None or stat.st_ino != self._inode):
+            # the file was rotated, so finish off the old one
+            count += self._read()
+            self._file.close()
+            self._file = None
+        if stat is None:
+            return count
+        if self._file is None:
+            self._open(stat)
+        elif os.fstat(self._file.fileno()).st_size < self._offset + len(self._partial):
+            # the file was truncated
+            self._file.seek(0)
+            self._offset, self._partial = 0, b""
+        count += self._read()
+        return count
+
+    def run(self):
+        """Follow the file until :meth:`Follow.stop` is called."""
+        delay = self._interval
+        while not self._halt.is_set():
+            if self.poll():
+                delay = self._interval
+            else:
+                delay = min(delay * 2, self._maximum)
+            self._halt.wait(delay)
+
+    def stop(self):
+        """Stop following the file."""
+        self._halt.set()
+
+    def close(self):
+        """Stop following the file, and send along any logs still being held."""
+        self.stop()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._stream.flush()
+
+    def _open(self, stat):
+        self._file = open(self._path, "rb")
+        if self._file.read(len(MAGIC)) == MAGIC:
+            raise ValueError("Binary log files can't be followed.")
+        self._inode = stat.st_ino
+        self._offset, self._partial = 0, b""
+        resume, self._resume = self._resume, None
+        if (resume is not None and resume["inode"] == stat.st_ino
+                and resume["offset"] <= stat.st_size):
+            self._offset = resume["offset"]
+        self._file.seek(self._offset)
+
+    def _read(self):
+        data = self._file.read()
+        if not data:
+            return 0
+        data = self._partial + data
+        end = data.rfind(b"\n") + 1
+        # keep the start of a log which hasn't been completely written yet
+        self._partial = data[end:]
+        count = 0
+        for line in data[:end].split(b"\n"):
+            if line.strip():
+                self._stream(line.decode("utf-8"))
+                count += 1
+        if end:
+            self._offset += end
+            self._save()
+        return count
+
+    def _save(self):
+        if self._checkpoint is not None:
+            temp = self._checkpoint + ".tmp"
+            with open(temp, "w") as f:
+                json.dump({"inode": self._inode, "offset": self._offset}, f)
+            os.rename(temp, self._checkpoint)
 
-    def __repr__(self):
-        return "".join(map(Tree(), self._logs))
+
+def paths(source):
+    """Get the files at a path, or matching a glob, from oldest to newest.
+
+    Files are ordered by their rotated segment index, with the file being
+    actively written to (the one without an index) coming last.
+    """
+    source = os.path.realpath(os.path.expanduser(source))
+    if os.path.exists(source):
+        return [source]
+    found = glob.glob(source)
+    if not found:
+        raise IOError("No such file(s): %r" % source)
+    return sorted(found, key=lambda p: (segment_index(p) or float("inf"), p))
+
+
+def records(source, processes=None):
+    """Iterate over the records in a path, glob, or iterable of logs.
+
+    Large files are decoded in parallel if a number of ``processes`` is
+    given (see :func:`read_parallel`).
+    """
+    if isinstance(source, str):
+        for path in paths(source):
+            if processes is None:
+                logs = read_records(path)
+            else:
+                logs = read_parallel(path, processes)
+            for log in logs:
+                yield log
+    else:
+        for log in source:
+            yield Record.load(log)
+
+
+def read_records(path):
+    """Iterate over the records in a file of JSON lines, or a binary log file."""
+    with _open(path) as f:
+        if f.read(len(MAGIC)) == MAGIC:
+            f.seek(0)
+            for log in load(f):
+                yield log
+        else:
+            f.seek(0)
+            for line in f:
+                if line.strip():
+                    try:
+                        log = Record.load(line.decode("utf-8"))
+                    except ValueError:
+                        if line.endswith(b"\n"):
+                            raise
+                        # the last log hasn't been completely written yet
+                        break
+                    yield log
+
+
+def read_parallel(path, processes=None, chunk=2 ** 22):
+    """Iterate over the records in a file of JSON lines using a process pool.
+
+    The file is memory mapped, and split into chunks of about ``chunk``
+    bytes which end on a newline. Each chunk is decoded by a worker process,
+    which sends back plain tuples, and the records are given back in order.
+    Compressed and binary files are read by :func:`read_records` instead.
+    """
+    if path.endswith((".gz", ".zlib")):
+        return read_records(path)
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if size <= chunk or f.read(len(MAGIC)) == MAGIC:
+            return read_records(path)
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        chunks, start = [], 0
+        while start < size:
+            end = data.find(b"\n", min(start + chunk, size) - 1)
+            end = size if end == -1 else end + 1
+            chunks.append((path, start, end))
+            start = end
+    finally:
+        data.close()
+    return _parallel(chunks, processes)
+
+
+def _parallel(chunks, processes):
+    processes = processes or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes)
+    try:
+        # only decode a few chunks ahead of the records being used
+        todo = iter(chunks)
+        pending = collections.deque(pool.apply_async(_read_chunk, (c,))
+            for c in itertools.islice(todo, processes * 2))
+        while pending:
+            part = pending.popleft().get()
+            for c in itertools.islice(todo, 1):
+                pending.append(pool.apply_async(_read_chunk, (c,)))
+            for data in part:
+                yield Record.from_tuple(data)
+    finally:
+        pool.terminate()
+
+
+def _read_chunk(chunk):
+    """Decode a chunk of a file into a list of record tuples."""
+    path, start, end = chunk
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        lines = data[start:end].split(b"\n")
+    finally:
+        data.close()
+    # empty unless the file doesn't end with a newline
+    last = lines.pop()
+    logs = [_tuple(line) for line in lines if line.strip()]
+    if last.strip():
+        try:
+            logs.append(_tuple(last))
+        except ValueError:
+            # the last log hasn't been completely written yet
+            pass
+    return logs
+
+
+def _tuple(line):
+    log = json.loads(line.decode("utf-8"))
+    metadata = log["metadata"]
+    timestamps = metadata["timestamps"]
+    return (metadata["title"], metadata["tag"], metadata["parent"],
+        metadata["status"], timestamps[0], timestamps[-1], log["content"],
+        metadata.get("usage"))
+
+
+def _open(path):
+    """Open a file for reading bytes, decompressing ``.gz`` and ``.zlib`` files."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    elif path.endswith(".zlib"):
+        with open(path, "rb") as f:
+            return io.BytesIO(zlib.decompress(f.read()))
+    else:
+        return open(path, "rb")
 
 
 class Stream(Switch):
     """Read a stream of log strings or dictionaries.
 
+    Logs are held until the book they belong to closes, and are then sent
+    to outlets along with the logs of its children, in the same order as
+    :class:`Complete` would give them. Any open ancestors are introduced
+    first. Only the logs of open books are kept, so a stream can run
+    indefinitely.
+
     Parameters
     ----------
     *outlets : callable
         A series of callable :class:`Outlet` objects that will receive logs one
-        at a time. Logs will be collected and then distributed in batches, in
-        order to make guesses about causes and effects. This only works for logs
-        that were created synchronously.
-
-    Notes
-    -----
-    The stream attempts to make educated guesses about causes and effects.
-    In other words, it will attempt to reorder the logs. This works well for
-    logs that were synchronously created.
-
-    For logs created in parrallel threads or processes, you should store your
-    logs in a file, and read them back with :class:`Complete`.
+        at a time.
+    watermark : float
+        How many seconds (by the time of the logs) to wait after a book closes
+        before sending it along. Logs from parallel threads or processes may
+        arrive out of order, and those that arrive within this time are still
+        put in their place.
     """
 
-    def __init__(self, *outlets):
-        self._hold = [] # all the logs up to that point
+    # how many released tags are remembered to recognize stragglers
+    _memory = 4096
+
+    def __init__(self, *outlets, **options):
         self._outlets = outlets
+        self._watermark = options.pop("watermark", 0.0)
+        if options:
+            raise TypeError("Unexpected options %s" % ", ".join(options))
+        self._books = {}
+        self._orphans = {}
+        self._due = []
+        self._released = collections.OrderedDict()
+        self._clock = float("-inf")
+        self._count = 0
 
     def __call__(self, log):
         """Add a log to the stream."""
-        if isinstance(log, str):
-            log = json.loads(log)
+        log = Record.load(log)
+        if log.tag in self._released:
+            # a straggler from a book that was already sent
+            return self._send(log)
+        self._count += 1
         self._switch(log)
+        if log.time > self._clock:
+            self._clock = log.time
+        due = self._due
+        while due and due[0][0] <= self._clock:
+            self._release(heapq.heappop(due)[2])
+
+    def flush(self):
+        """Send along the logs of every book, even those still open."""
+        books = self._books
+        for tag in sorted((t for t, b in books.items() if b.parent not in books),
+                key=lambda t: (books[t].start, books[t].order)):
+            self._release(tag)
+        books.clear()
+        self._orphans.clear()
+        del self._due[:]
+
+    def _book(self, log):
+        book = self._books.get(log.tag)
+        if book is None:
+            book = self._books[log.tag] = _Book(log.parent, log.start, self._count)
+            # children whose logs arrived before this book's
+            book.children = self._orphans.pop(log.tag, [])
+            if log.parent is not None and log.parent != log.tag:
+                parent = self._books.get(log.parent)
+                if parent is not None:
+                    parent.children.append(log.tag)
+                else:
+                    self._orphans.setdefault(log.parent, []).append(log.tag)
+        return book
 
     def _started(self, log):
-        tag = log["metadata"]["tag"]
-        parent = log["metadata"]["parent"]
-        self._hold.append(log)
+        self._book(log).started = log
 
     def _working(self, log):
-        self._hold.append(log)
+        self._book(log).held.append((log.time, self._count, log))
 
     def _default(self, log):
-        for i, l in enumerate(reversed(self._hold)):
-            meta = l["metadata"]
-            if log["metadata"]["tag"] in (meta["parent"], meta["tag"]):
-                self._hold.insert(-i, log)
-                break
-        else:
-            self._hold.append(log)
-        done = set()
-        send = []
-        for i, l in enumerate(reversed(self._hold)):
-            m = l["metadata"]
-            if m["status"] in ("success", "failure"):
-                done.add(m["tag"])
-            if m["status"] == "started":
-                if m["tag"] not in done:
-                    send.insert(0, l)
-                else:
-                    send.append(l)
+        self._book(log).closed.append((log.time, self._count, log))
+        heapq.heappush(self._due, (log.time + self._watermark, self._count, log.tag))
+
+    def _release(self, tag):
+        """Send a book, and its children, along - introducing its ancestors."""
+        book = self._books.get(tag)
+        if book is None:
+            return
+        ancestors = []
+        parent = self._books.get(book.parent)
+        while parent is not None and parent not in ancestors:
+            ancestors.append(parent)
+            parent = self._books.get(parent.parent)
+        for a in reversed(ancestors):
+            self._introduce(a, book.start)
+        parent = self._books.get(book.parent)
+        siblings = parent.children if parent else self._orphans.get(book.parent, ())
+        if tag in siblings:
+            siblings.remove(tag)
+            if not siblings and parent is None:
+                del self._orphans[book.parent]
+        stack = [self._items(tag)]
+        while stack:
+            item = next(stack[-1], None)
+            if item is None:
+                stack.pop()
+            elif isinstance(item, Record):
+                self._send(item)
             else:
-                send.append(l)
-        list(map(self._send, send))
-        self._hold.clear()
+                stack.append(self._items(item))
+
+    def _introduce(self, book, until):
+        """Send the logs of an open book which came before a child."""
+        if book.started is not None:
+            self._send(book.started)
+            book.started = None
+        book.held.sort(key=_order)
+        while book.held and book.held[0][0] < until:
+            self._send(book.held.pop(0)[2])
+
+    def _items(self, tag):
+        """Iterate over a book's logs, and the tags of its children, forgetting it."""
+        book = self._books[tag]
+        if book.started is not None:
+            yield book.started
+        books = self._books
+        events = [(books[t].start, books[t].order, t) for t in book.children]
+        events.extend(book.held)
+        events.sort(key=_order)
+        for event in events:
+            yield event[2]
+        for closed in sorted(book.closed, key=_order):
+            yield closed[2]
+        if book.closed:
+            del self._books[tag]
+            self._released[tag] = None
+            if len(self._released) > self._memory:
+                self._released.popitem(last=False)
+        else:
+            # an unfinished child of a closed book stands on its own now
+            book.started = None
+            book.parent = None
+            book.children = []
+            book.held = []
 
     def _send(self, log):
         for o in self._outlets:
             o(log)
+
+
+class _Book(object):
+    """The logs of a book in a :class:`Stream` which haven't been sent."""
+
+    __slots__ = ("parent", "start", "order", "started", "held", "children", "closed")
+
+    def __init__(self, parent, start, order):
+        self.parent = parent
+        self.start = start
+        self.order = order
+        self.started = None
+        self.held = []
+        self.children = []
+        self.closed = []
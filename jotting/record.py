@@ -0,0 +1,317 @@
+import json
+import struct
+from collections import namedtuple
+
+
+class Header(namedtuple("Header", ["title", "tag", "parent"])):
+    """The parts of a log which never change over the lifetime of a book."""
+
+    __slots__ = ()
+
+
+class Record(object):
+    """A single log message written by a :class:`jotting.book`.
+
+    Records are what distributors, styles, and readers pass around. Each one
+    refers to the :class:`Header` of the book that wrote it, and only carries
+    its own status, timestamp, and content along with the time the book was
+    started. Records can be converted to and from the dictionaries that are
+    stored as JSON, and for compatibility can be indexed like them (e.g.
+    ``record["metadata"]["status"]``).
+
+    Parameters
+    ----------
+    header : :class:`Header`
+        The title, tag, and parent of the book.
+    status : string
+        'started', 'working', 'success', or 'failure'.
+    start : float
+        The time the book was started.
+    time : float
+        The time this record was written.
+    content : dict
+        The content that was logged.
+    usage : dict or None
+        The resources a book used, given to its closing record when books
+        are measured (see :meth:`jotting.book.measure`). This may include the
+        ``"elapsed"`` time in seconds from a monotonic clock, the thread's
+        ``"cpu"`` time in seconds, and the number of ``"voluntary"`` and
+        ``"involuntary"`` context switches.
+    """
+
+    __slots__ = ("header", "status", "start", "time", "content", "usage")
+
+    def __init__(self, header, status, start, time, content, usage=None):
+        self.header = header
+        self.status = status
+        self.start = start
+        self.time = time
+        self.content = content
+        self.usage = usage
+
+    @property
+    def title(self):
+        return self.header[0]
+
+    @property
+    def tag(self):
+        return self.header[1]
+
+    @property
+    def parent(self):
+        return self.header[2]
+
+    @property
+    def duration(self):
+        """The number of seconds between the start of the book and this record.
+
+        A measured elapsed time is used when available, since it won't be
+        thrown off by adjustments to the system clock.
+        """
+        if self.usage is not None and "elapsed" in self.usage:
+            return self.usage["elapsed"]
+        return self.time - self.start
+
+    @property
+    def timestamps(self):
+        if self.time == self.start:
+            return [self.start]
+        else:
+            return [self.start, self.time]
+
+    @property
+    def metadata(self):
+        """A new dictionary of this record's metadata."""
+        metadata = {
+            "title": self.header[0],
+            "timestamps": self.timestamps,
+            "tag": self.header[1],
+            "parent": self.header[2],
+            "status": self.status,
+        }
+        if self.usage is not None:
+            metadata["usage"] = self.usage
+        return metadata
+
+    def copy(self):
+        """Get a copy of this record with its own content and usage."""
+        usage = self.usage
+        return type(self)(self.header, self.status, self.start, self.time,
+            dict(self.content), None if usage is None else dict(usage))
+
+    def to_dict(self):
+        """Convert this record to a dictionary that can be encoded as JSON."""
+        return {"metadata": self.metadata, "content": self.content}
+
+    @classmethod
+    def from_dict(cls, log):
+        """Create a record from a dictionary made by :meth:`to_dict`."""
+        metadata = log["metadata"]
+        header = Header(metadata["title"], metadata["tag"], metadata["parent"])
+        timestamps = metadata["timestamps"]
+        return cls(header, metadata["status"], timestamps[0],
+            timestamps[-1], log["content"], metadata.get("usage"))
+
+    def to_tuple(self):
+        """Convert this record to a tuple which is quick to pickle."""
+        header = self.header
+        return (header[0], header[1], header[2], self.status,
+            self.start, self.time, self.content, self.usage)
+
+    @classmethod
+    def from_tuple(cls, data):
+        """Create a record from a tuple made by :meth:`to_tuple`."""
+        return cls(Header(data[0], data[1], data[2]), *data[3:])
+
+    @classmethod
+    def load(cls, log):
+        """Get a record from a record, a dictionary, or a JSON string."""
+        if isinstance(log, cls):
+            return log
+        elif isinstance(log, dict):
+            return cls.from_dict(log)
+        else:
+            return cls.from_dict(json.loads(log))
+
+    def __getitem__(self, key):
+        if key == "metadata":
+            return self.metadata
+        elif key == "content":
+            return self.content
+        else:
+            raise KeyError(key)
+
+    def __reduce__(self):
+        return (type(self), (self.header, self.status,
+            self.start, self.time, self.content, self.usage))
+
+    def __repr__(self):
+        return "%s(%s, status=%r, time=%r)" % (type(self).__name__,
+            ", ".join("%s=%r" % i for i in self.header._asdict().items()),
+            self.status, self.time)
+
+
+# the binary format is a sequence of frames that each start with a kind byte
+MAGIC = b"JOTB\x01"
+_string = struct.Struct("<I")
+# status, title, tag, and parent indices, start and time in microseconds,
+# and the size of the JSON encoded content that follows
+_record = struct.Struct("<IIIIqqI")
+# measured records also have their elapsed and cpu time in nanoseconds, and
+# their voluntary and involuntary context switches
+_usage = struct.Struct("<qqqq")
+_usage_keys = ("elapsed", "cpu", "voluntary", "involuntary")
+_none = 0xFFFFFFFF
+
+
+class Packer(object):
+    """Encode records in a compact binary format with a string table.
+
+    The first time a title, tag, or status is seen in a batch it's written to
+    the string table, after which it's referred to by its index. Timestamps
+    are stored as integer microseconds, so only the content of a record is
+    encoded as JSON. Resource usage (see :meth:`jotting.book.measure`) is
+    stored as integers as well.
+
+    Each batch starts with :data:`MAGIC` and a string table of its own, so
+    batches can be appended to the same file by many writers (e.g. a parent
+    process and its forked children) without depending on one another.
+    """
+
+    def __init__(self):
+        self._table = {}
+        self._count = 0
+
+    @staticmethod
+    def content(log, encoder=json.JSONEncoder(default=str)):
+        """Encode the parts of a record which aren't in the string table."""
+        usage = log.usage
+        if usage is None or _packable(usage):
+            body = [log.content]
+        else:
+            body = [log.content, usage]
+        return encoder.encode(body).encode("utf-8")
+
+    def pack(self, items):
+        """Get the bytes for a list of ``(record, content)`` pairs.
+
+        The content should come from :meth:`Packer.content`.
+        """
+        out = [MAGIC]
+        self._table.clear()
+        self._count = 0
+        index = self._index
+        for log, content in items:
+            header = log.header
+            parent = _none if header[2] is None else index(header[2], out)
+            fixed = _record.pack(index(log.status, out),
+                index(header[0], out), index(header[1], out), parent,
+                int(round(log.start * 1e6)), int(round(log.time * 1e6)),
+                len(content))
+            usage = log.usage
+            if usage is not None and _packable(usage):
+                out.append(b"M" + fixed + _usage.pack(
+                    int(round(usage["elapsed"] * 1e9)),
+                    int(round(usage.get("cpu", -1e-9) * 1e9)),
+                    usage.get("voluntary", -1), usage.get("involuntary", -1)))
+            else:
+                out.append(b"R" + fixed)
+            out.append(content)
+        return b"".join(out)
+
+    def _index(self, string, out):
+        i = self._table.get(string)
+        if i is None:
+            i = self._table[string] = self._count
+            self._count += 1
+            data = string.encode("utf-8")
+            out.append(b"S" + _string.pack(len(data)) + data)
+        return i
+
+
+def unpack(data):
+    """Decode records from bytes written by a :class:`Packer`.
+
+    A partially written record at the end of the data is ignored.
+    """
+    return _Unpacker().decode(data)
+
+
+def load(f, chunk=2 ** 20):
+    """Decode records from a file written by a :class:`Packer`.
+
+    The file is read ``chunk`` bytes at a time, rather than all at once.
+    A partially written record at the end of the file is ignored.
+    """
+    unpacker, data = _Unpacker(), b""
+    while True:
+        more = f.read(chunk)
+        data = data[unpacker.position:] + more
+        for log in unpacker.decode(data):
+            yield log
+        if not more:
+            break
+
+
+class _Unpacker(object):
+    """Decodes records, keeping the string table between pieces of data."""
+
+    def __init__(self):
+        self.table, self.headers = [], {}
+        # where the last complete frame of the data ended
+        self.position = 0
+
+    def decode(self, data):
+        position, end = 0, len(data)
+        self.position = 0
+        while position < end:
+            kind = data[position:position + 1]
+            if kind == b"R" or kind == b"M":
+                start = position + 1 + _record.size
+                if kind == b"M":
+                    start += _usage.size
+                if start > end:
+                    break
+                (status, title, tag, parent, began, time,
+                    size) = _record.unpack_from(data, position + 1)
+                if start + size > end:
+                    break
+                position = start + size
+                table, key = self.table, (title, tag, parent)
+                header = self.headers.get(key)
+                if header is None:
+                    header = self.headers[key] = Header(table[title],
+                        table[tag], None if parent == _none else table[parent])
+                body = json.loads(data[start:position].decode("utf-8"))
+                if kind == b"M":
+                    values = _usage.unpack_from(
+                        data, start - _usage.size)
+                    body.append(dict((k, v) for k, v in zip(_usage_keys, (
+                        values[0] / 1e9, values[1] / 1e9) + values[2:]) if v >= 0))
+                self.position = position
+                yield Record(header, table[status], began / 1e6, time / 1e6, *body)
+            elif kind == b"S":
+                start = position + 1 + _string.size
+                if start > end:
+                    break
+                size = _string.unpack_from(data, position + 1)[0]
+                if start + size > end:
+                    break
+                position = start + size
+                self.table.append(data[start:position].decode("utf-8"))
+                self.position = position
+            elif data[position:position + len(MAGIC)] == MAGIC:
+                position += len(MAGIC)
+                self.table, self.headers = [], {}
+                self.position = position
+            elif MAGIC.startswith(data[position:]):
+                break
+            else:
+                raise ValueError("Not a binary log at byte %d" % position)
+
+
+def _packable(usage):
+    """Whether resource usage can be stored as integers."""
+    return "elapsed" in usage and all(
+        k in _usage_keys and isinstance(v, (int, float)) and v >= 0
+        for k, v in usage.items())
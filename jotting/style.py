@@ -2,20 +2,32 @@ import sys
 import json
 import datetime
 import inspect
+import collections
 from .util import Switch
+from .record import Record
 
 
 class Style(Switch):
     """The base :class:`Style` type."""
 
+    def key(self):
+        """Get a key shared by styles which format logs the same way.
+
+        By default styles are only equal to themselves. Styles without any
+        state or options can instead share their type as a key.
+        """
+        return self
+
     def __call__(self, log):
         """Return a formated log.
 
         Parameters
         ----------
-        log : dict
-            A log created by
+        log : :class:`jotting.record.Record` or dict
+            A log created by a :class:`jotting.book`.
         """
+        if not isinstance(log, Record):
+            log = Record.load(log)
         log = self._pre(log)
         if log:
             lines = self._switch(log)
@@ -32,7 +44,10 @@ class Style(Switch):
 
 
 class Raw(Style):
-    """Creates a string representation of the log object."""
+    """Creates a string representation of the log object.
+
+    The title, tag, and parent of each open book are only encoded once.
+    """
 
     class Encoder(json.JSONEncoder):
 
@@ -42,79 +57,183 @@ class Raw(Style):
             except:
                 return str(o)
 
+    def __init__(self):
+        self._encode = self.Encoder().encode
+        self._headers = {}
+        self._statuses = {}
+
+    def key(self):
+        if type(self) is Raw:
+            return Raw
+        # subclasses may format logs differently
+        return super(Raw, self).key()
+
     def _default(self, log):
-        return self.Encoder().encode(log)
+        encode = self._encode
+        header = log.header
+        parts = self._headers.get(header)
+        if parts is None:
+            if len(self._headers) >= 4096:
+                self._headers.clear()
+            # the parts of the line which never change for a book
+            parts = self._headers[header] = (
+                '{"metadata": {"title": %s, "timestamps": ' % encode(header[0]),
+                ', "tag": %s, "parent": %s, "status": ' % (
+                    encode(header[1]), encode(header[2])))
+        status = log.status
+        if status in ("success", "failure"):
+            self._headers.pop(header, None)
+        try:
+            status = self._statuses[status]
+        except KeyError:
+            status = self._statuses[status] = encode(status)
+        if log.time == log.start:
+            timestamps = "[%r]" % (log.start,)
+        else:
+            timestamps = "[%r, %r]" % (log.start, log.time)
+        if log.usage is None:
+            usage = ""
+        else:
+            usage = ', "usage": ' + encode(log.usage)
+        content = encode(log.content) if log.content else "{}"
+        return "%s%s%s%s%s}, \"content\": %s}" % (parts[0], timestamps,
+            parts[1], status, usage, content)
 
 
 class Log(Style):
     """A basic formater that only creates successes, and failures."""
 
+    def key(self):
+        if type(self) is Log:
+            return Log
+        return super(Log, self).key()
+
     def _pre(self, log):
-        if isinstance(log["metadata"]["title"], str):
+        if isinstance(log.title, str):
             return log
 
     def _completed(self, log):
-        metadata = log["metadata"]
-        status = metadata["status"]
-        duration = metadata["timestamps"][-1] - metadata["timestamps"][0]
-        timestamp = datetime.datetime.fromtimestamp(metadata["timestamps"][-1])
-        info = ", ".join(map(lambda i: "%s: %s" % i, log["content"].items()))
+        timestamp = datetime.datetime.fromtimestamp(log.time)
+        info = ", ".join(map(lambda i: "%s: %s" % i, log.content.items()))
         message = "{time} {status} {title} after {duration:.3f} seconds"
+        if log.usage is not None and "cpu" in log.usage:
+            message += " ({cpu:.3f} cpu)"
         if len(info) > 50:
             info = info[:47] + "..."
         if info:
             message += " - {info}"
-        yield message.format(time=timestamp, status=status.upper(),
-            title=metadata["title"], info=info, duration=duration)
+        yield message.format(time=timestamp, status=log.status.upper(),
+            title=log.title, info=info, duration=log.duration,
+            cpu=(log.usage or {}).get("cpu"))
 
     _success = _completed
     _failure = _completed
 
+    def _summary(self, log):
+        timestamp = datetime.datetime.fromtimestamp(log.time)
+        message = ("{time} SUMMARY {title} - {count} books, {failures} failed,"
+            " p50 {p50:.3f} p99 {p99:.3f} seconds")
+        yield message.format(time=timestamp, title=log.title, **log.content)
 
-class Tree(Style):
-    """An ascii tree representation for logs."""
 
-    def __init__(self):
-        self._depths = {}
+class Tree(Style):
+    """An ascii tree representation for logs.
+
+    The depth of each book is remembered until it, and all its children,
+    have closed.
+
+    Parameters
+    ----------
+    limit : int or None
+        The most books to remember at once. Past this, the least recently
+        used are forgotten, and any more of their logs are drawn as if they
+        had no parent.
+    """
+
+    def __init__(self, limit=None):
+        self._limit = limit
+        self._depths = collections.OrderedDict()
+        self._parents = {}
+        self._open = {}
+        self._closed = set()
 
     def _pre(self, log):
-        tag = log["metadata"]["tag"]
-        parent = log["metadata"]["parent"]
-        depth = self._depths.get(parent, -1) + 1
-        log["metadata"]["depth"] = self._depths[tag] = depth
+        tag, depths = log.tag, self._depths
+        depth = depths.pop(tag, None)
+        if depth is None:
+            parent = log.parent
+            if parent in depths:
+                depth = depths[parent] + 1
+                self._parents[tag] = parent
+                self._open[parent] = self._open.get(parent, 0) + 1
+            else:
+                depth = 0
+        # keep the most recently used books last
+        depths[tag] = depth
+        if self._limit is not None and len(depths) > self._limit:
+            self._forget(next(iter(depths)))
         return log
 
+    def _close(self, tag):
+        """Forget a closed book, and any closed parents it was holding on to."""
+        while tag in self._depths:
+            if self._open.get(tag):
+                self._closed.add(tag)
+                break
+            parent = self._parents.get(tag)
+            self._forget(tag)
+            if parent not in self._closed:
+                break
+            tag = parent
+
+    def _forget(self, tag):
+        del self._depths[tag]
+        self._open.pop(tag, None)
+        self._closed.discard(tag)
+        parent = self._parents.pop(tag, None)
+        if parent in self._open:
+            self._open[parent] -= 1
+
     def _started(self, log):
-        content, metadata = log["content"], log["metadata"]
-        indent = "|   " * metadata["depth"]
-        timestamp = datetime.datetime.fromtimestamp(metadata["timestamps"][-1])
-        yield indent + "|-- {status}: {title}".format(**metadata)
+        indent = "|   " * self._depths[log.tag]
+        timestamp = datetime.datetime.fromtimestamp(log.time)
+        yield indent + "|-- {0}: {1}".format(log.status, log.title)
         yield indent + "|   @ {0}".format(timestamp)
-        if "reason" in content:
-            yield indent + "|   | reason: {0}".format(content.pop("reason"))
-        for k, v in content.items():
-            yield indent + "|   | {0}: {1}".format(k, v)
+        for line in self._content(log.content):
+            yield indent + "|   | " + line
 
     def _working(self, log):
-        content, metadata = log["content"], log["metadata"]
-        indent = "|   " * (metadata["depth"] + 1)
-        timestamp = datetime.datetime.fromtimestamp(metadata["timestamps"][-1])
-        yield indent + "|-- {status}: {title}".format(**metadata)
+        indent = "|   " * (self._depths[log.tag] + 1)
+        timestamp = datetime.datetime.fromtimestamp(log.time)
+        yield indent + "|-- {0}: {1}".format(log.status, log.title)
         yield indent + "|   @ {0}".format(timestamp)
-        if "reason" in content:
-            yield indent + "|   | reason: {0}".format(content.pop("reason"))
-        for k, v in content.items():
-            yield indent + "|   | {0}: {1}".format(k, v)
+        for line in self._content(log.content):
+            yield indent + "|   | " + line
 
     def _default(self, log):
-        content, metadata = log["content"], log["metadata"]
-        indent = "|   " * (metadata["depth"] + 1)
-        timestamp = datetime.datetime.fromtimestamp(metadata["timestamps"][-1])
-        yield indent + "`-- {status}: {title}".format(**metadata)
+        indent = "|   " * (self._depths[log.tag] + 1)
+        timestamp = datetime.datetime.fromtimestamp(log.time)
+        yield indent + "`-- {0}: {1}".format(log.status, log.title)
         yield indent + "    @ {0}".format(timestamp)
-        diff = metadata["timestamps"][-1] - metadata["timestamps"][0]
-        content["duration"] = "{:.3f}".format(diff) + " seconds"
+        content = log.content
+        if "reason" in content:
+            yield indent + "|   | reason: {0}".format(content["reason"])
+        for k, v in content.items():
+            if k != "reason":
+                yield indent + "    | {0}: {1}".format(k, v)
+        yield indent + "    | duration: {:.3f} seconds".format(log.duration)
+        usage = log.usage or {}
+        if "cpu" in usage:
+            yield indent + "    | cpu: {:.3f} seconds".format(usage["cpu"])
+        if "voluntary" in usage:
+            yield indent + "    | switches: {0} voluntary, {1} involuntary".format(
+                usage["voluntary"], usage["involuntary"])
+        self._close(log.tag)
+
+    @staticmethod
+    def _content(content):
         if "reason" in content:
-            yield indent + "|   | reason: {0}".format(content.pop("reason"))
+            yield "reason: {0}".format(content["reason"])
         for k, v in content.items():
-            yield indent + "    | {0}: {1}".format(k, v)
+            if k != "reason":
+                yield "{0}: {1}".format(k, v)
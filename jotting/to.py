@@ -1,8 +1,19 @@
 import os
+import re
 import sys
+import zlib
+import gzip
+import glob
+import fnmatch
+import atexit
+import shutil
+import threading
+from time import time as now
 from copy import deepcopy
 from functools import wraps
 from .style import Raw
+from .util import Tags, Summary
+from .record import Header, Record, Packer
 
 
 def outlet(handler):
@@ -49,13 +60,67 @@ class Outlet(object):
         self._kwargs = kwargs
 
     def __call__(self, log):
-        if self._style is not None:
-            log = self._style(log)
+        log = self._format(log)
         if log is not None:
-            if not isinstance(log, str):
-                raise TypeError("Expected a string, not %r" % log)
             self._handler(log, *self._args, **self._kwargs)
 
+    def handle_batch(self, logs):
+        """Send a batch of logs wherever they need to go.
+
+        Parameters
+        ----------
+        logs : list
+            A list of unformated logs in the order they were recieved.
+        """
+        texts = self.format_batch(logs)
+        if texts:
+            self.handle_styled(texts)
+
+    def handle_styled(self, texts):
+        """Send a batch of logs which were already formatted in this outlet's style.
+
+        By default each log is passed to the handler one at a time. Subclasses
+        may override this to handle many logs at once more efficiently.
+
+        Parameters
+        ----------
+        texts : list
+            A list of formated logs in the order they were recieved.
+        """
+        for t in texts:
+            self._handler(t, *self._args, **self._kwargs)
+
+    def format_batch(self, logs):
+        """Apply this outlet's style to a batch of logs."""
+        return [t for t in map(self._format, logs) if t is not None]
+
+    def style_key(self):
+        """Get a key shared by outlets which format logs the same way.
+
+        Distributors format each batch of logs once for all the outlets with
+        the same key. The key is ``None`` when logs can't be shared.
+        """
+        style = self._style
+        if style is None:
+            return None
+        key = getattr(style, "key", None)
+        return id(style) if key is None else key()
+
+    def flush(self):
+        """Send along any logs this outlet is holding on to.
+
+        This is called by the distributor when no logs have arrived in a
+        while. By default outlets don't hold on to logs, so nothing happens.
+        """
+
+    def _format(self, log):
+        """Apply this outlet's style, returning a string or ``None``."""
+        if self._style is not None:
+            log = self._style(log)
+        if log is not None and not isinstance(log, str):
+            raise TypeError("Expected a string, not %r" % log)
+        return log
+
     def _handler(self, log, *args, **kwargs):
         """Send logs wherever they need to go.
 
@@ -73,20 +138,444 @@ class Outlet(object):
         raise NotImplementedError()
 
 
-@outlet
-def File(log, path):
+class File(Outlet):
     """Send logs to a file.
 
-    Each new log is appended in a new line to the given file.
+    Each new log is appended in a new line to the given file. By default the
+    file is opened and closed for every batch of logs. A persistent file
+    instead keeps its handle open, and buffers logs in memory until there are
+    ``buffer`` characters, ``interval`` seconds have passed, or the program
+    exits. If the file is moved or removed (e.g. by ``logrotate``) it's
+    reopened at the given path.
 
     Parameters
     ----------
+    style : callable
+        A function that returns a formated log string.
     path : string
         The place you'd like your logs to reside.
+    persist : bool
+        Whether to keep the file open and buffer logs in memory.
+    buffer : int
+        The number of characters a persistent file will buffer.
+    interval : float or None
+        The number of seconds a persistent file will buffer logs for.
+    sync : string or None
+        A durability policy for persistent files. If ``None``, buffered logs
+        are only written once a limit above is reached. For ``"flush"`` logs
+        are also written after every ``every`` logs, and for ``"fsync"`` they
+        are forced onto the disk as well.
+    every : int
+        How many logs may be written before the ``sync`` policy is applied.
     """
-    path = os.path.realpath(os.path.expanduser(path))
-    with open(path, "a+") as f:
-        f.write(log)
+
+    _mode = "a"
+
+    def __init__(self, style=Raw(), path=None, persist=False, buffer=65536,
+            interval=1.0, sync=None, every=1):
+        if sync not in (None, "flush", "fsync"):
+            raise ValueError("Unknown sync policy %r" % sync)
+        super(File, self).__init__(style)
+        self._path = os.path.realpath(os.path.expanduser(path))
+        self._persist = persist
+        self._buffer = buffer
+        self._interval = interval
+        self._sync = sync
+        self._every = every
+        self._file = None
+        self._forked()
+        if persist:
+            atexit.register(self.close)
+
+    def _handler(self, log):
+        self._write([log])
+
+    def handle_styled(self, texts):
+        self._write(texts)
+
+    def flush(self):
+        """Write any buffered logs to the file."""
+        if self._persist:
+            with self._lock:
+                self._drain()
+
+    def close(self):
+        """Write any buffered logs, and close the file."""
+        if self._persist:
+            with self._lock:
+                self._drain()
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+
+    def _write(self, texts):
+        if not self._persist:
+            with open(self._path, self._mode) as f:
+                f.write(self._render(texts))
+            return
+        if self._pid != os.getpid():
+            self._forked()
+        with self._lock:
+            self._pending.extend(texts)
+            self._size += self._sizeof(texts)
+            self._count += len(texts)
+            if (self._size >= self._buffer
+                    or (self._sync is not None and self._count >= self._every)
+                    or (self._interval is not None
+                        and now() - self._last >= self._interval)):
+                self._drain()
+
+    def _drain(self):
+        """Write the buffered logs - the caller should hold the lock."""
+        if self._pending:
+            f = self._open()
+            f.write(self._render(self._pending))
+            f.flush()
+            if self._sync == "fsync":
+                os.fsync(f.fileno())
+            del self._pending[:]
+            self._size = self._count = 0
+        self._last = now()
+
+    def _open(self):
+        """Return the open file, reopening it if it has been moved."""
+        f = self._file
+        if f is not None:
+            try:
+                stat = os.stat(self._path)
+            except OSError:
+                moved = True
+            else:
+                fstat = os.fstat(f.fileno())
+                moved = (stat.st_dev, stat.st_ino) != (fstat.st_dev, fstat.st_ino)
+            if moved:
+                f.close()
+                f = None
+        if f is None:
+            f = self._file = open(self._path, self._mode)
+        return f
+
+    def _render(self, texts):
+        """Get what should be written to the file for some logs."""
+        return "".join(texts)
+
+    def _sizeof(self, texts):
+        return sum(map(len, texts))
+
+    def _forked(self):
+        """Reset any state this process may have inherited from its parent."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._size = self._count = 0
+        self._last = now()
+
+
+class RotatingFile(File):
+    """Send logs to a file which is rotated by size or age.
+
+    Once the file grows past ``size`` characters, or is older than ``period``
+    seconds, it is renamed to a numbered segment (e.g. ``logbox.txt.3``) and
+    a new file is started in its place - larger numbers are newer segments.
+    Only the newest ``keep`` segments are kept around, and these may be
+    compressed. Compression and cleanup happen in a background thread so
+    they never hold up the delivery of logs. Rotating files are always
+    persistent. To read the logs back use a glob such as
+    ``read.Complete("logbox.txt*")``.
+
+    Parameters
+    ----------
+    style : callable
+        A function that returns a formated log string.
+    path : string
+        The place you'd like your logs to reside.
+    size : int or None
+        The number of characters a file may hold before it is rotated. A
+        log longer than this is written to a file of its own.
+    period : float or None
+        The number of seconds a file may be written to before it is rotated.
+    keep : int or None
+        How many rotated segments to keep. If ``None`` all are kept.
+    compress : string or None
+        Compress rotated segments with ``"gzip"`` or ``"zlib"``.
+    **options : any
+        Other options for a persistent :class:`File`.
+    """
+
+    _suffixes = {None: "", "gzip": ".gz", "zlib": ".zlib"}
+
+    def __init__(self, style=Raw(), path=None, size=None, period=None,
+            keep=None, compress=None, **options):
+        if compress not in self._suffixes:
+            raise ValueError("Unknown compression %r" % compress)
+        options["persist"] = True
+        super(RotatingFile, self).__init__(style, path, **options)
+        self._limit = size
+        self._period = period
+        self._keep = keep
+        self._compress = compress
+        self._opened = now()
+        self._written = 0
+        self._index = max([0] + list(map(segment_index, self.segments())))
+
+    def segments(self):
+        """Get the paths of all rotated segments, from oldest to newest."""
+        pattern = glob.escape(self._path) if hasattr(glob, "escape") else self._path
+        paths = [p for p in glob.glob(pattern + ".*") if segment_index(p)]
+        return sorted(paths, key=segment_index)
+
+    def _drain(self):
+        if self._pending:
+            self._open()
+            if (self._written and self._period is not None
+                    and now() - self._opened >= self._period):
+                self._rotate()
+            if self._limit is not None:
+                self._split()
+        size = self._sizeof(self._pending)
+        super(RotatingFile, self)._drain()
+        self._written += size
+
+    def _split(self):
+        """Write, and rotate past, the pending logs that don't fit in the file."""
+        texts, start, written = self._pending, 0, self._written
+        for i, text in enumerate(texts):
+            size = self._sizeof([text])
+            if written and written + size > self._limit:
+                self._pending = texts[start:i]
+                super(RotatingFile, self)._drain()
+                self._rotate()
+                start, written = i, 0
+            written += size
+        self._pending = texts[start:]
+
+    def _open(self):
+        old = self._file
+        f = super(RotatingFile, self)._open()
+        if f is not old:
+            self._opened = now()
+            self._written = os.fstat(f.fileno()).st_size
+        return f
+
+    def _rotate(self):
+        """Move the current file to a new segment - the caller should hold the lock."""
+        self._file.close()
+        self._file = None
+        self._index += 1
+        segment = "%s.%d" % (self._path, self._index)
+        os.rename(self._path, segment)
+        self._written = 0
+        _janitor.put(self._cleanup, segment)
+
+    def _cleanup(self, segment):
+        """Compress a new segment, and remove old ones (in the background)."""
+        if self._compress is not None:
+            compress(segment, self._compress)
+        if self._keep is not None:
+            segments = self.segments()
+            for path in segments[:max(len(segments) - self._keep, 0)]:
+                os.remove(path)
+
+
+class BinaryFile(File):
+    """Send logs to a file in a compact binary format.
+
+    Titles, tags, and statuses are written to a string table once, and then
+    referred to by index, while timestamps are stored as integers. This
+    makes files several times smaller than JSON lines, and quicker to read.
+    Whenever the file is (re)opened, a new string table is started. Use
+    :class:`jotting.read.Complete` to read the logs back. Binary files
+    don't have a style.
+
+    Parameters
+    ----------
+    path : string
+        The place you'd like your logs to reside.
+    **options : any
+        Other options for :class:`File` - ``buffer`` is counted in bytes.
+    """
+
+    _mode = "ab"
+
+    def __init__(self, path=None, **options):
+        self._packer = Packer()
+        super(BinaryFile, self).__init__(None, path, **options)
+
+    def _format(self, log):
+        log = Record.load(log)
+        return log, Packer.content(log)
+
+    def style_key(self):
+        return None
+
+    def _render(self, texts):
+        return self._packer.pack(texts)
+
+    def _sizeof(self, texts):
+        return sum(len(content) + 24 for log, content in texts)
+
+
+class Rollup(Outlet):
+    """Summarize books by title, rather than sending along every log.
+
+    The closing logs of books are counted by title, and every ``interval``
+    seconds a record with the status ``"summary"`` is sent to the given
+    outlets for each title. Its content has the ``"count"`` of books, how
+    many were ``"failures"``, the ``"total"``, ``"min"``, ``"max"``, and
+    ``"mean"`` duration, estimated quantiles (e.g. ``"p99"``), and a
+    ``"histogram"`` with the ``"buckets"`` of a :class:`jotting.util.Sketch`
+    and how many durations fell in each. Other logs of those books are
+    dropped.
+
+    Parameters
+    ----------
+    *outlets : callable
+        The outlets which recieve the summaries.
+    interval : float
+        The number of seconds between summaries.
+    titles : iterable of strings or None
+        Patterns for the titles to summarize, which may contain shell-style
+        wildcards. Logs with other titles are passed along as they are. If
+        ``None`` every title is summarized.
+    accuracy : float
+        The relative accuracy of quantiles, and the width of histogram buckets.
+    """
+
+    def __init__(self, *outlets, **options):
+        super(Rollup, self).__init__(None)
+        self._outlets = outlets
+        self._interval = options.pop("interval", 60.0)
+        titles = options.pop("titles", None)
+        self._titles = None if titles is None else tuple(titles)
+        self._accuracy = options.pop("accuracy", 0.01)
+        if options:
+            raise TypeError("Unexpected options %s" % ", ".join(options))
+        self._summaries = {}
+        self._since = now()
+        atexit.register(self.close)
+
+    def __call__(self, log):
+        self.handle_batch([log])
+
+    def handle_batch(self, logs):
+        passed = []
+        for log in map(Record.load, logs):
+            if not self._rolled(log.title):
+                passed.append(log)
+            elif log.status in ("success", "failure"):
+                summary = self._summaries.get(log.title)
+                if summary is None:
+                    summary = self._summaries[log.title] = Summary(self._accuracy)
+                summary.add(log)
+        if passed:
+            self._send(passed)
+        if now() - self._since >= self._interval:
+            self._summarize()
+
+    def flush(self):
+        if now() - self._since >= self._interval:
+            self._summarize()
+        for o in self._outlets:
+            flush = getattr(o, "flush", None)
+            if flush is not None:
+                flush()
+
+    def close(self):
+        """Send along summaries of the books counted so far."""
+        self._summarize()
+
+    def _rolled(self, title):
+        return self._titles is None or any(
+            fnmatch.fnmatchcase(title, t) for t in self._titles)
+
+    def _summarize(self):
+        start, stop = self._since, now()
+        summaries, self._summaries, self._since = self._summaries, {}, stop
+        logs = []
+        for title, summary in summaries.items():
+            content = summary.to_dict()
+            sketch = summary.sketch
+            content["histogram"] = {"accuracy": sketch.accuracy,
+                "zeros": sketch.zeros, "buckets": dict(
+                    (str(k), c) for k, c in sketch.buckets.items())}
+            logs.append(Record(Header(title, _new_tag(), None),
+                "summary", start, stop, content))
+        if logs:
+            self._send(logs)
+
+    def _send(self, logs):
+        for o in self._outlets:
+            handle_batch = getattr(o, "handle_batch", None)
+            if handle_batch is not None:
+                handle_batch(logs)
+            else:
+                for l in logs:
+                    o(l)
+
+
+_new_tag = Tags()
+
+
+def segment_index(path):
+    """Get the index of a rotated segment from its path, or ``0``."""
+    match = re.search(r"\.(\d+)(\.gz|\.zlib)?$", path)
+    return int(match.group(1)) if match else 0
+
+
+def compress(path, method):
+    """Compress a file with ``"gzip"`` or ``"zlib"``, replacing the original."""
+    target = path + RotatingFile._suffixes[method]
+    head, tail = os.path.split(target)
+    # write to a hidden file so readers never see partial segments
+    temp = os.path.join(head, "." + tail)
+    with open(path, "rb") as src:
+        if method == "gzip":
+            with gzip.open(temp, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        else:
+            z = zlib.compressobj()
+            with open(temp, "wb") as dst:
+                for chunk in iter(lambda: src.read(65536), b""):
+                    dst.write(z.compress(chunk))
+                dst.write(z.flush())
+    os.rename(temp, target)
+    os.remove(path)
+
+
+class _Janitor(object):
+    """Runs housekeeping tasks for outlets in a background thread."""
+
+    def __init__(self):
+        self._tasks = []
+        self._ready = threading.Condition(threading.Lock())
+        self._thread = None
+
+    def put(self, function, *args):
+        with self._ready:
+            self._tasks.append((function, args))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            self._ready.notify()
+
+    def _run(self):
+        while True:
+            with self._ready:
+                while not self._tasks:
+                    self._ready.wait()
+                function, args = self._tasks.pop(0)
+            try:
+                function(*args)
+            except Exception:
+                # housekeeping should never take down logging
+                pass
+
+
+_janitor = _Janitor()
 
 
 @outlet
@@ -94,3 +583,7 @@ def Print(log):
     """Send logs directly to ``sys.stdout``"""
     sys.stdout.write(log)
     sys.stdout.flush()
+
+
+if sys.version_info >= (3, 5):
+    from ._to_py35 import AsyncOutlet
@@ -1,6 +1,32 @@
+import os
 import sys
+import math
+import time
 import types
 import inspect
+import binascii
+import itertools
+from string import Formatter
+try:
+    import reprlib
+except ImportError:  # Python 2
+    import repr as reprlib
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+if hasattr(time, "perf_counter_ns"):
+    perf_counter_ns = time.perf_counter_ns
+elif hasattr(time, "perf_counter"):
+    def perf_counter_ns():
+        return int(time.perf_counter() * 1e9)
+else:
+    def perf_counter_ns():
+        return int(time.time() * 1e9)
+
+thread_time_ns = getattr(time, "thread_time_ns", None)
+RUSAGE_THREAD = getattr(resource, "RUSAGE_THREAD", None)
 
 if sys.version_info > (3, 3):
     from inspect import signature
@@ -30,6 +56,11 @@ def to_title(x, inputs):
     return title
 
 
+def is_template(title):
+    """Whether a string title has fields to be formatted with a book's content."""
+    return any(field is not None for _, field, _, _ in Formatter().parse(title))
+
+
 def enclosed(x):
     """Return a function or class that was decorated by a function."""
     if inspect.isclass(x):
@@ -59,12 +90,65 @@ def enclosed(x):
         return x
 
 
+# names used by the code CallMap.compile generates
+_generated = ("_jotting_defaults", "_jotting_content", "_jotting_list", "_jotting_r")
+
+
 class CallMap(object):
     """Map partial, or complete args and kwargs onto a function's signature."""
 
     def __init__(self, function):
         self.parameters = dict(signature(function).parameters)
 
+    def compile(self, content=None):
+        """Create a fast function that maps a call onto the signature.
+
+        The returned function is called with the same ``*args, **kwargs`` as
+        the original function, and returns a dictionary of the given content
+        updated with the name and value of each parameter. It has the same
+        signature as the original, so it raises a ``TypeError`` for calls the
+        original would not accept. If the signature can't be reproduced then
+        ``None`` is returned instead.
+        """
+        content = dict(content or {})
+        params, defaults, values = [], [], []
+        kinds = [pkind(p) for p in self.parameters.values()]
+        if "POSITIONAL_ONLY" in kinds and sys.version_info < (3, 8):
+            return None
+        for name, p, kind in zip(self.parameters, self.parameters.values(), kinds):
+            if name in _generated:
+                return None
+            if kind == "KEYWORD_ONLY" and "VAR_POSITIONAL" not in kinds:
+                if "*" not in params:
+                    params.append("*")
+            if kind == "VAR_POSITIONAL":
+                params.append("*" + name)
+                values.append((name, "_jotting_list(%s)" % name))
+                continue
+            elif kind == "VAR_KEYWORD":
+                params.append("**" + name)
+            elif p.default is not p.empty:
+                params.append("%s=_jotting_defaults[%d]" % (name, len(defaults)))
+                defaults.append(p.default)
+            else:
+                params.append(name)
+            values.append((name, name))
+            if kind == "POSITIONAL_ONLY" and (len(kinds) == len(values)
+                    or kinds[len(values)] != "POSITIONAL_ONLY"):
+                params.append("/")
+        if content:
+            body = ["    _jotting_r = _jotting_content.copy()"]
+            body.extend("    _jotting_r[%r] = %s" % v for v in values)
+            body.append("    return _jotting_r")
+        else:
+            items = ", ".join("%r: %s" % v for v in values)
+            body = ["    return {%s}" % items]
+        source = "def mapper(%s):\n%s\n" % (", ".join(params), "\n".join(body))
+        namespace = {"_jotting_defaults": defaults,
+            "_jotting_content": content, "_jotting_list": list}
+        exec(compile(source, "<jotting.util.CallMap>", "exec"), namespace)
+        return namespace["mapper"]
+
     def map(self, args, kwargs):
         mapping, used = {}, []
         for i, name in enumerate(self.parameters):
@@ -95,18 +179,266 @@ class CallMap(object):
 
     @staticmethod
     def KEYWORD_ONLY(index, param, args, kwargs, used_keys):
+        used_keys.append(param.name)
         return kwargs.get(param.name, param.default)
 
     @staticmethod
     def VAR_KEYWORD(index, param, args, kwargs, used_keys):
-        return {k : v for k, v in kwargs.items() if k in used_keys}
+        return {k : v for k, v in kwargs.items() if k not in used_keys}
+
+
+class Capture(object):
+    """A policy for what :meth:`jotting.book.mark` records about calls.
+
+    By default every argument, and the return value, is recorded by reference
+    which keeps them in memory until logs are distributed. A policy can
+    instead leave arguments out, record only their type, or record a short
+    ``repr`` of them. This work is only done for books which are sampled.
+
+    Parameters
+    ----------
+    exclude : iterable of strings
+        The names of arguments to leave out.
+    typed : iterable of strings or True
+        The names of arguments recorded only by the name of their type. If
+        ``True`` all arguments, and the return value, are recorded this way.
+    length : int or None
+        Record arguments and return values as a ``repr`` with at most this
+        many characters.
+    depth : int or None
+        Record arguments and return values as a ``repr`` in which containers
+        are only written out this many levels deep.
+    returns : bool
+        Whether to record return values.
+    """
+
+    def __init__(self, exclude=(), typed=(), length=None, depth=None, returns=True):
+        self.exclude = frozenset(exclude)
+        self.typed = typed if typed is True else frozenset(typed)
+        self.returns = returns
+        self.length = length
+        if length is None and depth is None:
+            self._repr = None
+        else:
+            self._repr = reprlib.Repr()
+            if depth is not None:
+                self._repr.maxlevel = depth
+            if length is not None:
+                self._repr.maxstring = self._repr.maxother = length
+                if hasattr(self._repr, "maxlong"):
+                    self._repr.maxlong = length
+
+    def arguments(self, mapping, exempt=None):
+        """Get the content to record for a mapping of argument names to values.
+
+        Entries that are identical to those in ``exempt`` are left as they are.
+        """
+        captured = {}
+        for k, v in mapping.items():
+            if exempt and k in exempt and exempt[k] is v:
+                captured[k] = v
+            elif k in self.exclude:
+                continue
+            elif self.typed is True or k in self.typed:
+                captured[k] = type(v).__name__
+            else:
+                captured[k] = self.value(v)
+        return captured
+
+    def value(self, value):
+        """Get what should be recorded in place of the given value."""
+        if self.typed is True:
+            return type(value).__name__
+        elif self._repr is None:
+            return value
+        text = self._repr.repr(value)
+        if self.length is not None and len(text) > self.length:
+            text = text[:max(self.length - 3, 0)] + "..."
+        return text
+
+
+class Tags(object):
+    """Create short tags which are unique across threads and processes.
+
+    Each tag is a random prefix, chosen once per process, followed by the
+    value of a counter in hexidecimal. This is much cheaper than creating a
+    :func:`uuid.uuid4` for every tag. Forked processes choose a new prefix
+    so they never share tags with their parent.
+    """
+
+    def __init__(self):
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+            self._pid = None
+
+    def __call__(self):
+        if self._pid is not None and self._pid != os.getpid():
+            self._reset()
+        return "%s%x" % (self._prefix, next(self._counter))
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._prefix = binascii.hexlify(os.urandom(6)).decode("ascii")
+        self._counter = itertools.count()
+
+
+class Sketch(object):
+    """A mergeable summary of a distribution for estimating its quantiles.
+
+    Positive values are counted in buckets whose bounds grow geometrically,
+    so any quantile is estimated to within a relative ``accuracy`` while the
+    number of buckets only grows with the logarithm of the range of values.
+    Sketches of the same accuracy can be merged, so values may be summarized
+    in separate processes, and combined later.
+
+    Parameters
+    ----------
+    accuracy : float
+        The relative accuracy of estimated quantiles.
+    """
+
+    def __init__(self, accuracy=0.01):
+        if not 0 < accuracy < 1:
+            raise ValueError("Accuracy must be between 0 and 1.")
+        self.accuracy = accuracy
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+        self._gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self._gamma)
+
+    def add(self, value, count=1):
+        """Count a value, or many of the same value."""
+        if value <= 0:
+            self.zeros += count
+        else:
+            key = int(math.ceil(math.log(value) / self._log_gamma))
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.count += count
+
+    def merge(self, other):
+        """Add the values counted by another sketch to this one."""
+        if other.accuracy != self.accuracy:
+            raise ValueError("Can't merge sketches of different accuracy.")
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zeros += other.zeros
+        self.count += other.count
+        return self
+
+    def quantile(self, q):
+        """Estimate the value below which a fraction ``q`` of values fall."""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if rank < seen:
+                return 2 * self._gamma ** key / (self._gamma + 1)
+        return 2 * self._gamma ** max(self.buckets) / (self._gamma + 1)
+
+
+class Summary(object):
+    """Running statistics about the durations of books.
+
+    Parameters
+    ----------
+    accuracy : float
+        The relative accuracy of duration quantiles.
+    """
+
+    def __init__(self, accuracy=0.01):
+        self.count = 0
+        self.failures = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.sketch = Sketch(accuracy)
+
+    def add(self, log):
+        """Count the closing log of a book."""
+        self.count += 1
+        if log.status == "failure":
+            self.failures += 1
+        duration = log.duration
+        self.total += duration
+        self.sketch.add(duration)
+        self._extremes(duration, duration)
+
+    def merge(self, other):
+        """Add the books counted by another summary to this one."""
+        self.count += other.count
+        self.failures += other.failures
+        self.total += other.total
+        if other.count:
+            self._extremes(other.minimum, other.maximum)
+        self.sketch.merge(other.sketch)
+        return self
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    @property
+    def failure_rate(self):
+        return self.failures / float(self.count) if self.count else None
+
+    def quantile(self, q):
+        """Estimate the duration below which a fraction ``q`` of books fall."""
+        return self.sketch.quantile(q)
+
+    def to_dict(self):
+        return {"count": self.count, "failures": self.failures,
+            "failure_rate": self.failure_rate, "total": self.total,
+            "mean": self.mean, "min": self.minimum, "max": self.maximum,
+            "p50": self.quantile(0.5), "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99)}
+
+    def _extremes(self, minimum, maximum):
+        if self.minimum is None or minimum < self.minimum:
+            self.minimum = minimum
+        if self.maximum is None or maximum > self.maximum:
+            self.maximum = maximum
+
+
+def usage():
+    """Take a snapshot of the resources used by the current thread so far.
+
+    Returns
+    -------
+    tuple
+        A monotonic time, the thread's CPU time (both in nanoseconds), and
+        its voluntary and involuntary context switches. Any that aren't
+        available on this platform are ``None``.
+    """
+    cpu = thread_time_ns() if thread_time_ns is not None else None
+    if RUSAGE_THREAD is not None:
+        ru = resource.getrusage(RUSAGE_THREAD)
+        return perf_counter_ns(), cpu, ru.ru_nvcsw, ru.ru_nivcsw
+    return perf_counter_ns(), cpu, None, None
+
+
+def usage_since(before):
+    """Get a dictionary of the resources used since a :func:`usage` snapshot."""
+    after = usage()
+    used = {"elapsed": (after[0] - before[0]) / 1e9}
+    if before[1] is not None:
+        used["cpu"] = (after[1] - before[1]) / 1e9
+    if before[2] is not None:
+        used["voluntary"] = after[2] - before[2]
+        used["involuntary"] = after[3] - before[3]
+    return used
 
 
 class Switch(object):
     """Sends logs to functions based on status."""
 
     def _switch(self, log, *args, **kwargs):
-        status = log["metadata"]["status"]
+        status = log.status
         method = getattr(self, "_" + status, None) or self._default
         if method is not None:
             return method(log, *args, **kwargs)